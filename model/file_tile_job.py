@@ -0,0 +1,32 @@
+from PIL.Image import Image as PngImage
+from osgeo_utils.gdal2tiles import TileDetail
+
+from model.preread_window import PrereadWindow
+from model.rabbit_message import TileCreateRequest, FileTileCreate
+from model.tile_creator_instance import TileCreatorInstance
+
+
+class FileTileJob:
+    tile_request: TileCreateRequest
+    file: FileTileCreate
+    tile_file_path: str
+    tile_creator: TileCreatorInstance
+    tile_detail: TileDetail
+
+    # Set by the read planner when the window is shared with the other jobs of its cluster
+    preread: PrereadWindow | None = None
+
+    # Filled by the pipeline stages
+    data: bytes | None = None
+    alpha: bytes | None = None
+    tile_dataset = None
+    image: PngImage | None = None
+    encoded: bytes | None = None
+
+    def __init__(self, tile_request: TileCreateRequest, file: FileTileCreate, tile_creator: TileCreatorInstance,
+                 tile_detail: TileDetail):
+        self.tile_request = tile_request
+        self.file = file
+        self.tile_file_path = tile_request.get_file_tile_path(file)
+        self.tile_creator = tile_creator
+        self.tile_detail = tile_detail
@@ -0,0 +1,8 @@
+class GdalConfig:
+    # Tile worker processes sharing this host, the memory and cores are split between them
+    worker_count: int = 1
+    # Share of the worker memory given to the GDAL block cache and the VSI file cache
+    cache_fraction: float = 0.25
+    vsi_cache_fraction: float = 0.05
+    # Largest window read ahead once for several tiles of a batch
+    max_preread_bytes: int = 64 * 1024 * 1024
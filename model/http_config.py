@@ -0,0 +1,9 @@
+class HttpConfig:
+    enabled: bool = False
+    host: str = '0.0.0.0'
+    port: int = 8080
+    cache_bytes: int = 256 * 1024 * 1024
+    # A missed tile is rendered synchronously at most this long, then the rest is published as a follow-up
+    render_timeout_ms: int = 5000
+    # Directory holding one sub directory per layer, each with a layer.json tile request template
+    layers_directory: str = ''
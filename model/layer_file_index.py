@@ -0,0 +1,26 @@
+from typing import List
+
+from model.rabbit_message import FileTileCreate
+from util.spatial_index import SpatialIndex, Bounds
+
+
+class LayerFileIndex:
+    directory: str
+    # Files of the layer in request order
+    files: List[FileTileCreate]
+    # Mercator footprint by file name, it may hold more files than the index
+    footprints: dict[str, Bounds]
+    spatial_index: SpatialIndex
+
+    def __init__(self, directory: str, files: List[FileTileCreate], footprints: dict[str, Bounds]):
+        self.directory = directory
+        self.files = files
+        self.footprints = footprints
+        self.spatial_index = SpatialIndex([(footprints[file.name], position) for position, file in enumerate(files)])
+
+    def has_files(self, files: List[FileTileCreate]) -> bool:
+        return len(files) == len(self.files) and all(a.name == b.name for a, b in zip(files, self.files))
+
+    def query(self, bounds: Bounds) -> List[FileTileCreate]:
+        """Files whose footprint touches the bounds, in request order"""
+        return [self.files[position] for position in sorted(self.spatial_index.query(bounds))]
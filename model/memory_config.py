@@ -0,0 +1,10 @@
+class MemoryConfig:
+    # 0 means 80% of the memory available to this worker (host or cgroup memory / GDAL_WORKER_COUNT)
+    rss_limit_bytes: int = 0
+    # Caches are evicted above this share of the limit
+    soft_fraction: float = 0.85
+    # Caches are evicted at most once per this many seconds while memory stays above the soft limit
+    eviction_interval_seconds: int = 30
+    # Consumption is paused at most this long while the limit is exceeded
+    max_pause_seconds: int = 30
+    tile_creator_cache_size: int = 64
@@ -0,0 +1,24 @@
+class MemoryStats:
+    rss_bytes: int = 0
+    peak_rss_bytes: int = 0
+    limit_bytes: int = 0
+    image_buffers: int = 0
+    image_bytes: int = 0
+    peak_image_bytes: int = 0
+    datasets: int = 0
+    peak_datasets: int = 0
+    cache_sizes: dict[str, int]
+    evictions: int = 0
+    pauses: int = 0
+
+    def __init__(self):
+        self.cache_sizes = dict()
+
+    def __str__(self) -> str:
+        mb = 1024 * 1024
+        caches = ', '.join('%s=%d' % (name, size) for name, size in self.cache_sizes.items())
+        return ('rss=%dMB peak_rss=%dMB limit=%dMB images=%d (%dMB, peak %dMB) datasets=%d (peak %d) '
+                'evictions=%d pauses=%d caches: %s' %
+                (self.rss_bytes // mb, self.peak_rss_bytes // mb, self.limit_bytes // mb, self.image_buffers,
+                 self.image_bytes // mb, self.peak_image_bytes // mb, self.datasets, self.peak_datasets,
+                 self.evictions, self.pauses, caches))
@@ -0,0 +1,12 @@
+class PipelineConfig:
+    queue_size: int = 8
+
+    # I/O stages (GDAL reads and disk writes release the GIL)
+    read_workers: int = 4
+    write_workers: int = 2
+
+    # CPU stages (resampling and encoding)
+    cpu_workers: int = 2
+
+    # Render the file tiles of a request and of sibling children together, instead of one after another
+    parallel_file_tiles: bool = True
@@ -0,0 +1,18 @@
+class PipelineStageStats:
+    name: str
+    worker_count: int
+    processed: int = 0
+    failed: int = 0
+    busy_seconds: float = 0.0
+    idle_seconds: float = 0.0
+    blocked_seconds: float = 0.0  # Time spent waiting on a full downstream queue
+    max_queue_depth: int = 0
+
+    def __init__(self, name: str, worker_count: int):
+        self.name = name
+        self.worker_count = worker_count
+
+    def __str__(self) -> str:
+        return ('%s[workers=%d]: processed=%d failed=%d busy=%.1fms idle=%.1fms blocked=%.1fms max_queue=%d' %
+                (self.name, self.worker_count, self.processed, self.failed, self.busy_seconds * 1000,
+                 self.idle_seconds * 1000, self.blocked_seconds * 1000, self.max_queue_depth))
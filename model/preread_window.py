@@ -0,0 +1,61 @@
+import threading
+
+import numpy
+from osgeo_utils.gdal2tiles import TileDetail
+
+
+class PrereadWindow:
+    """
+    A source window read once for several tile jobs whose reads touch the same blocks.
+    It is loaded by the first job of the cluster reaching the read stage and released after the last one.
+    """
+    source: str
+    x: int
+    y: int
+    width: int
+    height: int
+    bands_count: int
+    data: numpy.ndarray | None = None  # (bands, height, width)
+    mask: numpy.ndarray | None = None  # (height, width)
+    # Held while loading, so the other jobs of the cluster wait for the window instead of reading themselves
+    lock: threading.Lock
+    _references: int
+
+    def __init__(self, source: str, x: int, y: int, width: int, height: int, bands_count: int, references: int):
+        self.source = source
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.bands_count = bands_count
+        self.lock = threading.Lock()
+        self._references = references
+
+    def covers(self, tile_detail: TileDetail) -> bool:
+        # Downsampled reads may use overviews in GDAL, they are left to ReadRaster
+        if tile_detail.wxsize < tile_detail.rxsize or tile_detail.wysize < tile_detail.rysize:
+            return False
+
+        return (self.x <= tile_detail.rx and tile_detail.rx + tile_detail.rxsize <= self.x + self.width and
+                self.y <= tile_detail.ry and tile_detail.ry + tile_detail.rysize <= self.y + self.height)
+
+    def read(self, tile_detail: TileDetail) -> tuple[bytes, bytes]:
+        """Same result as ReadRaster of the window with nearest neighbour buffer scaling"""
+        columns = self._get_source_indexes(tile_detail.rx - self.x, tile_detail.rxsize, tile_detail.wxsize)
+        rows = self._get_source_indexes(tile_detail.ry - self.y, tile_detail.rysize, tile_detail.wysize)
+
+        data = self.data[:, rows[:, None], columns[None, :]]
+        alpha = self.mask[rows[:, None], columns[None, :]]
+        return numpy.ascontiguousarray(data).tobytes(), numpy.ascontiguousarray(alpha).tobytes()
+
+    def release(self):
+        """Called once by each job of the cluster, the buffers are dropped after the last one"""
+        with self.lock:
+            self._references -= 1
+            if self._references <= 0:
+                self.data = self.mask = None
+
+    @staticmethod
+    def _get_source_indexes(offset: int, size: int, buffer_size: int) -> numpy.ndarray:
+        indexes = ((numpy.arange(buffer_size) + 0.5) * (size / buffer_size)).astype(numpy.int64)
+        return offset + numpy.minimum(indexes, size - 1)
@@ -8,3 +8,4 @@ class RabbitConfig:
     connection_attempts: int = 100
     retry_delay: int = 2  # In seconds
     socket_timeout: int = 10  # In seconds
+    prefetch_count: int = 4  # Unacknowledged tile requests, lowered to 1 under memory pressure
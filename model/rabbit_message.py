@@ -9,6 +9,11 @@ from util.environment_loader import load_base_directory, load_upload_base_direct
 base_directory = load_base_directory()
 upload_base_directory = load_upload_base_directory()
 
+# Outputs are written here first and renamed into place, so a tile path never holds a partial file
+PARTIAL_DIRECTORY = '.partial'
+# Lossless copies of tiles stored with a lossy format, kept until their parent is composited
+LOSSLESS_DIRECTORY = '.lossless'
+
 
 class RabbitMessage(BaseModel):
     directory: str = ''
@@ -28,6 +33,37 @@ class FileTileCreate(BaseModel):
     resampling: str = 'near'
 
 
+class TileEncoding(BaseModel):
+    # PNG, PNG8 (palette), WEBP, JPEG or AUTO (JPEG for opaque tiles and transparentFormat for the others)
+    format: str = 'PNG'
+    # Used for tiles having transparent pixels when format is JPEG or AUTO: PNG, PNG8 or WEBP
+    transparentFormat: str = 'PNG'
+
+    # 0 (no compression) to 9 (smallest), 6 is the zlib default
+    pngCompressLevel: int = 6
+    # default, filtered, huffman, rle, fixed
+    pngStrategy: str = 'default'
+    paletteColors: int = 256
+
+    webpQuality: int = 80
+    webpLossless: bool = False
+    # 0 (fast) to 6 (slow, smaller)
+    webpMethod: int = 4
+
+    jpegQuality: int = 85
+
+    # Compress level of the intermediate file tiles which are composited and removed afterwards
+    intermediateCompressLevel: int = 1
+
+    def is_lossless(self) -> bool:
+        """True when no tile can be stored with a lossy format"""
+        tile_format = self.format.upper()
+        if tile_format == 'WEBP':
+            return self.webpLossless
+
+        return tile_format == 'PNG'
+
+
 class TileCreateRequest(RabbitMessage):
     z: int = 0
     x: int = 0
@@ -37,6 +73,7 @@ class TileCreateRequest(RabbitMessage):
     files: List[FileTileCreate] = []
     startPoint: str = 'TOP_LEFT'
     pattern: str = 'morteza/{z}/{x}/{y}.png'
+    encoding: TileEncoding = TileEncoding()
 
     def get_raster_file_path(self, file: FileTileCreate) -> str:
         return self.get_directory_path() + "/" + file.name
@@ -65,9 +102,15 @@ class TileCreateRequest(RabbitMessage):
     def get_file_tile_path(self, file: FileTileCreate):
         return self.get_tile_path() + '_' + file.name + '.temp'
 
+    def get_lossless_tile_path(self) -> str:
+        return '%s/%s/%d/%d/%d.png' % (self.get_directory_path(), LOSSLESS_DIRECTORY, self.z, self.x, self.y)
+
     def get_file_temp_directory(self, file: FileTileCreate) -> str:
         return self.get_directory_path()
 
+    def get_partial_directory(self) -> str:
+        return self.get_directory_path() + '/' + PARTIAL_DIRECTORY
+
     def get_children(self) -> List['TileCreateRequest']:
         returned = []
         for i in range(2):
@@ -106,6 +149,32 @@ class TileCreateRequest(RabbitMessage):
         return os.path.exists(file_tile_path)
 
 
+class RasterUpdateRequest(TileCreateRequest):
+    """
+    Sent after a source raster of a layer (one of files) is replaced or updated in place.
+    z, x and y are not used; all tiles between minZoom and maxZoom touching the changed region are invalidated.
+    """
+    updatedFile: str = ''
+    minZoom: int = 0
+    maxZoom: int = 21
+    # The removed tiles are published as TILE_CREATE_REQUEST messages to be created again
+    rebuild: bool = True
+
+    def get_updated_file(self) -> FileTileCreate:
+        for file in self.files:
+            if file.name == self.updatedFile:
+                return file
+
+        raise Exception('Updated file "%s" is not one of the layer files' % self.updatedFile)
+
+    def get_tile_request(self, z: int, x: int, y: int) -> TileCreateRequest:
+        tile_request = TileCreateRequest(**self.model_dump(include=set(TileCreateRequest.model_fields)))
+        tile_request.z = z
+        tile_request.x = x
+        tile_request.y = y
+        return tile_request
+
+
 class LayerInfoRequest(RabbitMessage):
     id: str = ''
     file: str = 'origin.tif'
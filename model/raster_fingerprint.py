@@ -0,0 +1,35 @@
+from pydantic import BaseModel
+
+
+class RasterFingerprint(BaseModel):
+    width: int = 0
+    height: int = 0
+    bandCount: int = 0
+    geoTransform: list = list()
+    projection: str = ''
+    blockSize: int = 1024
+    # Checksum of each blockSize x blockSize window, row by row
+    checksums: list = list()
+
+    def is_compatible(self, other: 'RasterFingerprint') -> bool:
+        """Blocks can only be compared one by one when both rasters have the same grid"""
+        return (self.width == other.width and self.height == other.height and self.bandCount == other.bandCount
+                and self.geoTransform == other.geoTransform and self.projection == other.projection
+                and self.blockSize == other.blockSize and len(self.checksums) == len(other.checksums))
+
+    def get_block_count_x(self) -> int:
+        return (self.width + self.blockSize - 1) // self.blockSize
+
+    def get_block_count_y(self) -> int:
+        return (self.height + self.blockSize - 1) // self.blockSize
+
+    def get_block_window(self, index: int) -> tuple[int, int, int, int]:
+        block_x = index % self.get_block_count_x()
+        block_y = index // self.get_block_count_x()
+        x = block_x * self.blockSize
+        y = block_y * self.blockSize
+        return x, y, min(self.blockSize, self.width - x), min(self.blockSize, self.height - y)
+
+    def get_changed_windows(self, other: 'RasterFingerprint') -> list[tuple[int, int, int, int]]:
+        return [self.get_block_window(index) for index, checksum in enumerate(self.checksums)
+                if checksum != other.checksums[index]]
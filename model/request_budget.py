@@ -0,0 +1,42 @@
+import time
+
+
+class RequestBudget:
+    """Wall-clock budget of a single tile request"""
+    started: float  # time.perf_counter() based
+    deadline: float
+    max_tiles: int
+    created_tiles: int = 0
+    pending_ms: float = 0.0  # Estimated cost of reserved tiles which are not rendered yet
+    skipped: bool = False  # Some work was left because the budget ran out
+
+    def __init__(self, budget_ms: float, max_tiles: int):
+        self.started = time.perf_counter()
+        self.deadline = self.started + budget_ms / 1000
+        self.max_tiles = max_tiles
+
+    def remaining_ms(self) -> float:
+        return (self.deadline - time.perf_counter()) * 1000
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def is_exhausted(self) -> bool:
+        # The first tile is always allowed, so every request makes progress
+        if self.created_tiles == 0:
+            return False
+
+        return self.created_tiles >= self.max_tiles or self.remaining_ms() - self.pending_ms <= 0
+
+    def try_reserve(self, cost_ms: float) -> bool:
+        if self.created_tiles > 0 and (self.created_tiles >= self.max_tiles or
+                                       self.remaining_ms() - self.pending_ms < cost_ms):
+            self.skipped = True
+            return False
+
+        self.created_tiles += 1
+        self.pending_ms += cost_ms
+        return True
+
+    def commit(self):
+        self.pending_ms = 0.0
@@ -5,6 +5,10 @@ class TileCreatorInstance:
     key: str
     gdal2tiles: GDAL2Tiles
     tile_job_info: TileJobInfo
+    # File tile jobs reading the temporary file of GDAL2Tiles which are not finished yet
+    in_flight: int = 0
+    # Dropped from the cache, its temporary directory is removed once no job reads it
+    dropped: bool = False
 
     def __init__(self, key: str, gdal2tiles: GDAL2Tiles, tile_job_info: TileJobInfo):
         self.key = key
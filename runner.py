@@ -6,18 +6,27 @@ from pika import BasicProperties
 from pika.adapters.blocking_connection import BlockingChannel
 
 from model.rabbit_config import RabbitConfig
-from model.rabbit_message import TileCreateRequest, LayerInfoRequest, LayerInfoResponse, FileTileCreate
+from model.rabbit_message import TileCreateRequest, LayerInfoRequest, LayerInfoResponse, FileTileCreate, \
+    RasterUpdateRequest
 from util.rabbit import Rabbit
-from util.environment_loader import load_rabbit_config
+from util.environment_loader import load_rabbit_config, load_http_config
+from util.memory_governor import memory_governor
 from util.raster_info import fetch_info
+from util.tile_cache import TileMemoryCache
 from util.tile_creator import TileCreator
+from util.tile_http_server import TileHttpServer
+from util.tile_updater import TileUpdater
 
 
 class Runner:
     _configs: RabbitConfig
     _tile_creator: TileCreator
+    _tile_updater: TileUpdater
     _rabbit: Rabbit
     _logger: logging.Logger
+    _queue_depth_checked: float = 0.0
+    _unfinished_builds: list[TileCreateRequest]
+    _prefetch_lowered: bool = False
 
     def __init__(self):
         self._logger = logging.getLogger(__name__)
@@ -25,26 +34,115 @@ class Runner:
 
         self._configs = load_rabbit_config()
         self._tile_creator = TileCreator()
+        # Before anything can journal a new build
+        self._unfinished_builds = self._tile_creator.recover_unfinished_builds()
+        tile_cache = self._start_http_server()
+        self._tile_updater = TileUpdater(self._tile_creator, self._publish_tile_create_request_threadsafe, tile_cache)
         self._connect_to_rabbit()
 
+    def _start_http_server(self) -> TileMemoryCache | None:
+        http_config = load_http_config()
+        if not http_config.enabled:
+            return None
+
+        tile_cache = TileMemoryCache(http_config.cache_bytes)
+        memory_governor.register_cache('http_tile_cache_mb', lambda: tile_cache.get_size() // (1024 * 1024),
+                                       tile_cache.clear)
+        TileHttpServer(http_config, self._tile_creator, self._publish_tile_create_request_threadsafe,
+                       tile_cache).start()
+        return tile_cache
+
+    def _publish_tile_create_request(self, tile_request: TileCreateRequest):
+        self._rabbit.channel.basic_publish(self._configs.exchange, 'TILE_CREATE_REQUEST',
+                                           tile_request.model_dump_json())
+
+    def _publish_tile_create_request_threadsafe(self, tile_request: TileCreateRequest):
+        # The blocking connection is not thread safe, so the publish runs on the consumer thread
+        self._rabbit.connection.add_callback_threadsafe(lambda: self._publish_tile_create_request(tile_request))
+
     def _receive_tile_create_message(self, ch: BlockingChannel, method, properties: BasicProperties, body: bytes):
         data_str = body.decode('utf-8')
         data_dict = json.loads(data_str)
         try:
             tile_request = TileCreateRequest(**data_dict)
             self._logger.debug('Receive new "TILE_CREATE_REQUEST" message: ' + tile_request.model_dump_json())
-            self._tile_creator.create_tile(tile_request)
+            self._update_queue_depth()
+            if self._tile_creator.create_tile(tile_request):
+                # Work skipped because of the time budget continues as a follow-up job instead of a client retry
+                self._logger.debug('Scheduling follow-up for tile: %s' % tile_request.get_tile_path())
+                self._rabbit.channel.basic_publish(self._configs.exchange, 'TILE_CREATE_REQUEST',
+                                                   tile_request.model_dump_json())
         except Exception as exception:
             self._logger.error('Occur Error in creating tile: %s with error: %s' % (data_dict, repr(exception)))
             import traceback
             traceback.print_exc()
+        finally:
+            ch.basic_ack(method.delivery_tag)
+            self._apply_memory_backpressure(ch)
+
+    def _apply_memory_backpressure(self, ch: BlockingChannel):
+        # Under pressure only one unacknowledged request is delivered and the next one waits for memory
+        if memory_governor.wait_for_memory(self._rabbit.connection.sleep):
+            if not self._prefetch_lowered:
+                ch.basic_qos(prefetch_count=1)
+                self._prefetch_lowered = True
+        elif self._prefetch_lowered:
+            ch.basic_qos(prefetch_count=self._configs.prefetch_count)
+            self._prefetch_lowered = False
+
+    def _update_queue_depth(self):
+        # Passive declare is a broker round trip, so the depth is refreshed at most once per second
+        if time.time() - self._queue_depth_checked < 1:
+            return
+
+        self._queue_depth_checked = time.time()
+        declared = self._rabbit.channel.queue_declare(self._get_tile_create_request_queue(), passive=True)
+        self._tile_creator.work_budget.set_queue_depth(declared.method.message_count)
+
+    def _get_tile_create_request_queue(self) -> str:
+        return self._configs.exchange + '.tile-create-request'
 
     def _init_listen_to_tile_create_messages(self):
         self._logger.info('Listening to "TILE_CREATE_REQUEST" messages ...')
-        tile_create_request_queue = self._configs.exchange + '.tile-create-request'
+        tile_create_request_queue = self._get_tile_create_request_queue()
         self._rabbit.channel.queue_declare(tile_create_request_queue, durable=True)
         self._rabbit.channel.queue_bind(tile_create_request_queue, self._configs.exchange, 'TILE_CREATE_REQUEST')
-        self._rabbit.channel.basic_consume(tile_create_request_queue, self._receive_tile_create_message, True)
+        # Manual acknowledgement, so the prefetch count bounds the requests held in memory
+        self._rabbit.channel.basic_qos(prefetch_count=self._configs.prefetch_count)
+        self._prefetch_lowered = False
+        self._rabbit.channel.basic_consume(tile_create_request_queue, self._receive_tile_create_message, False)
+
+    def _receive_raster_update_message(self, ch: BlockingChannel, method, properties: BasicProperties, body: bytes):
+        data_str = body.decode('utf-8')
+        data_dict = json.loads(data_str)
+        try:
+            update_request = RasterUpdateRequest(**data_dict)
+            self._logger.debug('Receive new "RASTER_UPDATE_REQUEST" message: ' + update_request.model_dump_json())
+            # Acknowledged by the updater thread once done, the consumer thread keeps serving heartbeats
+            self._tile_updater.submit(update_request, lambda: self._ack_threadsafe(ch, method.delivery_tag))
+        except Exception as exception:
+            self._logger.error('Occur Error in updating tiles: %s with error: %s' % (data_dict, repr(exception)))
+            import traceback
+            traceback.print_exc()
+            ch.basic_ack(method.delivery_tag)
+
+    def _ack_threadsafe(self, ch: BlockingChannel, delivery_tag: int):
+        def ack():
+            # The channel may have been closed meanwhile, the message is then delivered again
+            if ch.is_open:
+                ch.basic_ack(delivery_tag)
+
+        try:
+            ch.connection.add_callback_threadsafe(ack)
+        except Exception as exception:
+            self._logger.warning('Could not acknowledge message %d: %s' % (delivery_tag, repr(exception)))
+
+    def _init_listen_to_raster_update_messages(self):
+        self._logger.info('Listening to "RASTER_UPDATE_REQUEST" messages ...')
+        raster_update_queue = self._configs.exchange + '.raster-update-request'
+        self._rabbit.channel.queue_declare(raster_update_queue, durable=True)
+        self._rabbit.channel.queue_bind(raster_update_queue, self._configs.exchange, 'RASTER_UPDATE_REQUEST')
+        self._rabbit.channel.basic_consume(raster_update_queue, self._receive_raster_update_message, False)
 
     def _receive_raster_info_message(self, ch: BlockingChannel, method, properties: BasicProperties, body: bytes):
         data_str = body.decode('utf-8')
@@ -69,6 +167,13 @@ class Runner:
         self._rabbit.channel.queue_bind(raster_info_queue, self._configs.exchange, 'INFO_REQUEST')
         self._rabbit.channel.basic_consume(raster_info_queue, self._receive_raster_info_message, True)
 
+    def _resume_unfinished_builds(self):
+        for tile_request in self._unfinished_builds:
+            self._logger.info('Resuming unfinished tile build: %s' % tile_request.get_tile_path())
+            self._rabbit.channel.basic_publish(self._configs.exchange, 'TILE_CREATE_REQUEST',
+                                               tile_request.model_dump_json())
+        self._unfinished_builds = []
+
     def _run_test(self):
         self._logger.warning('Sending test request to rabbit ...')
         tile = TileCreateRequest()
@@ -115,6 +220,8 @@ class Runner:
             self._rabbit = Rabbit(self._configs)
             self._init_listen_to_raster_info_messages()
             self._init_listen_to_tile_create_messages()
+            self._init_listen_to_raster_update_messages()
+            self._resume_unfinished_builds()
 
             # Test
             self._run_test()
@@ -0,0 +1,107 @@
+import os
+import tempfile
+import time
+import unittest
+
+from model.rabbit_message import TileCreateRequest, FileTileCreate, PARTIAL_DIRECTORY
+from util.build_journal import BuildJournal
+
+
+class BuildJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_directory = tempfile.TemporaryDirectory()
+        self.journal_directory = self._temp_directory.name + '/journal'
+        self.layer = self._temp_directory.name + '/layer'
+        os.makedirs(self.layer)
+
+    def tearDown(self):
+        self._temp_directory.cleanup()
+
+    def _tile_request(self, z: int, x: int, y: int) -> TileCreateRequest:
+        tile_request = TileCreateRequest(directory=self.layer, pattern='{z}/{x}/{y}.png', startCreateTileZoom=18)
+        tile_request.z, tile_request.x, tile_request.y = z, x, y
+        tile_request.files = [FileTileCreate(name='east.tif'), FileTileCreate(name='west.tif')]
+        return tile_request
+
+    @staticmethod
+    def _touch(path: str, age_seconds: float = 0):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'tile')
+        if age_seconds:
+            modified = time.time() - age_seconds
+            os.utime(path, (modified, modified))
+
+    def _recover(self, worker_id: str = 'w') -> list[str]:
+        return sorted(tile_request.get_tile_path() for tile_request in
+                      BuildJournal(self.journal_directory, worker_id).recover())
+
+    def test_returns_unfinished_builds_only(self):
+        journal = BuildJournal(self.journal_directory, 'w')
+        finished, unfinished = self._tile_request(17, 1, 1), self._tile_request(17, 1, 2)
+        entry_id = journal.begin(finished)
+        journal.begin(unfinished)
+        journal.end(finished, entry_id)
+
+        self.assertEqual([unfinished.get_tile_path()], self._recover())
+        # The journal is removed once recovered
+        self.assertEqual([], self._recover())
+
+    def test_ignores_journals_of_other_workers(self):
+        own, other = self._tile_request(17, 1, 1), self._tile_request(17, 1, 2)
+        BuildJournal(self.journal_directory, 'w').begin(own)
+        BuildJournal(self.journal_directory, 'w-2').begin(other)
+        BuildJournal(self.journal_directory, 'west').begin(other)
+
+        self.assertEqual([own.get_tile_path()], self._recover('w'))
+        self.assertEqual(2, len(os.listdir(self.journal_directory)))
+        self.assertEqual([other.get_tile_path()], self._recover('w-2'))
+        self.assertEqual([other.get_tile_path()], self._recover('west'))
+
+    def test_skips_a_cut_last_line(self):
+        journal = BuildJournal(self.journal_directory, 'w')
+        unfinished = self._tile_request(17, 1, 1)
+        journal.begin(unfinished)
+        journal_path = os.path.join(self.journal_directory, os.listdir(self.journal_directory)[0])
+        with open(journal_path, 'a') as f:
+            f.write('{"op": "end", "id": "')
+
+        self.assertEqual([unfinished.get_tile_path()], self._recover())
+
+    def test_existing_tiles_are_not_resumed_and_their_intermediates_are_removed(self):
+        journal = BuildJournal(self.journal_directory, 'w')
+        existing, missing = self._tile_request(17, 1, 1), self._tile_request(17, 1, 2)
+        journal.begin(existing)
+        journal.begin(missing)
+
+        self._touch(existing.get_tile_path())
+        self._touch(existing.get_file_tile_path(existing.files[0]))
+        child_lossless_path = existing.get_children()[0].get_lossless_tile_path()
+        self._touch(child_lossless_path)
+        missing_file_tile_path = missing.get_file_tile_path(missing.files[1])
+        self._touch(missing_file_tile_path)
+
+        self.assertEqual([missing.get_tile_path()], self._recover())
+        self.assertTrue(os.path.exists(existing.get_tile_path()))
+        self.assertFalse(os.path.exists(existing.get_file_tile_path(existing.files[0])))
+        self.assertFalse(os.path.exists(child_lossless_path))
+        # Still needed by the resumed build
+        self.assertTrue(os.path.exists(missing_file_tile_path))
+
+    def test_removes_own_partial_outputs_whatever_their_age(self):
+        BuildJournal(self.journal_directory, 'w').begin(self._tile_request(17, 1, 1))
+        partial_directory = self.layer + '/' + PARTIAL_DIRECTORY
+        own = partial_directory + '/w-' + 'a' * 32
+        other_recent = partial_directory + '/w-2-' + 'b' * 32
+        other_old = partial_directory + '/w-2-' + 'c' * 32
+        self._touch(own)
+        self._touch(other_recent)
+        self._touch(other_old, 60 * 60)
+
+        self._recover()
+        self.assertEqual([os.path.basename(other_recent)], os.listdir(partial_directory))
+
+
+if __name__ == '__main__':
+    unittest.main()
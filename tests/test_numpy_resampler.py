@@ -0,0 +1,149 @@
+import unittest
+from collections import Counter
+from types import SimpleNamespace
+
+import numpy
+
+try:
+    from osgeo import gdal
+except ImportError:
+    gdal = None
+
+from util.numpy_resampler import NumpyResampler
+
+TILE_SIZE = 4
+
+
+def _tile_detail(query_size: int, wx: int = 0, wy: int = 0, wxsize: int = 0, wysize: int = 0) -> SimpleNamespace:
+    return SimpleNamespace(querysize=query_size, wx=wx, wy=wy, wxsize=wxsize or query_size - wx,
+                           wysize=wysize or query_size - wy)
+
+
+def _reference(data: numpy.ndarray, alpha: numpy.ndarray, tile_detail: SimpleNamespace,
+               resampling: str) -> numpy.ndarray:
+    """Pixel by pixel version of the GDAL rules, every band reduced on its own"""
+    bands = data.shape[0]
+    query_size = tile_detail.querysize
+    factor = query_size // TILE_SIZE
+    pixels = factor * factor
+
+    query = numpy.zeros((bands + 1, query_size, query_size), numpy.int64)
+    wx, wy = tile_detail.wx, tile_detail.wy
+    query[:bands, wy:wy + tile_detail.wysize, wx:wx + tile_detail.wxsize] = data
+    query[bands, wy:wy + tile_detail.wysize, wx:wx + tile_detail.wxsize] = alpha
+
+    tile = numpy.zeros((bands + 1, TILE_SIZE, TILE_SIZE), numpy.int64)
+    for ty in range(TILE_SIZE):
+        for tx in range(TILE_SIZE):
+            if resampling == 'near':
+                tile[:, ty, tx] = query[:, ty * factor + factor // 2, tx * factor + factor // 2]
+                continue
+
+            block = query[:, ty * factor:(ty + 1) * factor, tx * factor:(tx + 1) * factor].reshape(bands + 1, -1)
+            for band in range(bands + 1):
+                values = [int(value) for value in block[band]]
+                if resampling == 'average':
+                    tile[band, ty, tx] = (sum(values) + pixels // 2) // pixels
+                elif resampling == 'mode':
+                    tile[band, ty, tx] = _most_frequent(values)
+                else:
+                    tile[band, ty, tx] = max(values) if resampling == 'max' else min(values)
+
+    return tile
+
+
+def _most_frequent(values: list) -> int:
+    # The smallest value wins on ties
+    counts = Counter(values)
+    return min(counts, key=lambda value: (-counts[value], value))
+
+
+class NumpyResamplerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.resampler = NumpyResampler()
+        self.random = numpy.random.default_rng(7)
+
+    def _check(self, tile_detail: SimpleNamespace, bands: int, alpha: numpy.ndarray | None = None):
+        shape = (tile_detail.wysize, tile_detail.wxsize)
+        # Few distinct values, so 'mode' has ties
+        data = self.random.choice([0, 17, 128, 255], size=(bands,) + shape).astype(numpy.uint8)
+        if alpha is None:
+            alpha = self.random.choice([0, 0, 90, 255, 255], size=shape).astype(numpy.uint8)
+
+        for resampling in NumpyResampler.SUPPORTED_RESAMPLINGS:
+            with self.subTest(resampling=resampling, querysize=tile_detail.querysize, wx=tile_detail.wx,
+                              wy=tile_detail.wy):
+                resampled = self.resampler.resample(data.tobytes(), alpha.tobytes(), tile_detail, bands, TILE_SIZE,
+                                                    resampling)
+                self.assertIsNotNone(resampled)
+                tile = numpy.frombuffer(resampled, numpy.uint8).reshape(bands + 1, TILE_SIZE, TILE_SIZE)
+                numpy.testing.assert_array_equal(tile, _reference(data, alpha, tile_detail, resampling))
+
+    def test_full_windows(self):
+        for factor in (2, 3, 4):
+            self._check(_tile_detail(TILE_SIZE * factor), 3)
+
+    def test_partial_windows(self):
+        self._check(_tile_detail(8, wx=3), 3)
+        self._check(_tile_detail(12, wy=5), 1)
+        self._check(_tile_detail(16, wx=1, wy=6, wxsize=9, wysize=7), 3)
+
+    def test_fully_transparent_blocks(self):
+        tile_detail = _tile_detail(8)
+        alpha = numpy.full((8, 8), 255, numpy.uint8)
+        alpha[:4, :] = 0
+        alpha[4:6, 4:6] = 0
+        self._check(tile_detail, 3, alpha)
+        self._check(tile_detail, 3, numpy.zeros((8, 8), numpy.uint8))
+
+    def test_falls_back_to_gdal(self):
+        data, alpha = bytes(3 * 64), bytes(64)
+        self.assertIsNone(self.resampler.resample(data, alpha, _tile_detail(8), 3, TILE_SIZE, 'bilinear'))
+        self.assertIsNone(self.resampler.resample(data, alpha, _tile_detail(10), 3, TILE_SIZE, 'average'))
+        # More bytes per pixel than Byte bands
+        self.assertIsNone(self.resampler.resample(bytes(6 * 64), alpha, _tile_detail(8), 3, TILE_SIZE, 'average'))
+
+
+@unittest.skipUnless(gdal is not None, 'GDAL is not installed')
+class NumpyResamplerGdalParityTest(unittest.TestCase):
+    """The fast path must create the same tiles as the MEM dataset scaling it replaces"""
+
+    def setUp(self):
+        self.resampler = NumpyResampler()
+        self.random = numpy.random.default_rng(11)
+
+    @staticmethod
+    def _gdal_tile(data: bytes, alpha: bytes, tile_detail: SimpleNamespace, bands: int,
+                   resampling: str) -> numpy.ndarray:
+        from util.tile_creator import TileCreator
+
+        mem_drv = gdal.GetDriverByName('MEM')
+        tile_dataset = mem_drv.Create('', TILE_SIZE, TILE_SIZE, bands + 1)
+        ds_query = mem_drv.Create('', tile_detail.querysize, tile_detail.querysize, bands + 1)
+        ds_query.WriteRaster(tile_detail.wx, tile_detail.wy, tile_detail.wxsize, tile_detail.wysize, data,
+                             band_list=list(range(1, bands + 1)))
+        ds_query.WriteRaster(tile_detail.wx, tile_detail.wy, tile_detail.wxsize, tile_detail.wysize, alpha,
+                             band_list=[bands + 1])
+
+        TileCreator._scale_query_to_tile(ds_query, tile_dataset, SimpleNamespace(resampling=resampling))
+        return numpy.frombuffer(tile_dataset.ReadRaster(0, 0, TILE_SIZE, TILE_SIZE), numpy.uint8).reshape(
+            bands + 1, TILE_SIZE, TILE_SIZE)
+
+    def test_same_tiles_as_gdal(self):
+        bands = 3
+        for tile_detail in (_tile_detail(8), _tile_detail(12, wx=5), _tile_detail(16, wx=1, wy=6, wxsize=9, wysize=7)):
+            shape = (tile_detail.wysize, tile_detail.wxsize)
+            data = self.random.choice([0, 17, 128, 255], size=(bands,) + shape).astype(numpy.uint8).tobytes()
+            alpha = self.random.choice([0, 0, 90, 255, 255], size=shape).astype(numpy.uint8).tobytes()
+
+            for resampling in NumpyResampler.SUPPORTED_RESAMPLINGS:
+                with self.subTest(resampling=resampling, querysize=tile_detail.querysize):
+                    resampled = self.resampler.resample(data, alpha, tile_detail, bands, TILE_SIZE, resampling)
+                    tile = numpy.frombuffer(resampled, numpy.uint8).reshape(bands + 1, TILE_SIZE, TILE_SIZE)
+                    numpy.testing.assert_array_equal(
+                        tile, self._gdal_tile(data, alpha, tile_detail, bands, resampling))
+
+
+if __name__ == '__main__':
+    unittest.main()
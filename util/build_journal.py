@@ -0,0 +1,177 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from typing import IO, List
+
+from model.rabbit_message import TileCreateRequest, PARTIAL_DIRECTORY, LOSSLESS_DIRECTORY
+
+# The journal of a layer is truncated once nothing is in progress and it grows beyond this size
+_COMPACT_SIZE = 1024 * 1024
+# Other workers may share the layer directory, so only their partial files older than this are removed
+_PARTIAL_MAX_AGE_SECONDS = 10 * 60
+# Lossless copies whose parent was never requested are removed after this age, at worst the parent is then
+# composited once from the lossy tile
+_LOSSLESS_MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+
+
+class BuildJournal:
+    """
+    Append-only journal of the tile builds in progress, one file per layer.
+    A 'begin' line without its 'end' line means the worker died while building that subtree.
+    """
+    _directory: str
+    _worker_id: str
+    _journal_name: re.Pattern
+    _files: dict[str, IO]
+    _open_entries: dict[str, int]
+    _lock: threading.Lock
+    _logger: logging.Logger
+
+    def __init__(self, directory: str, worker_id: str):
+        self._logger = logging.getLogger(__name__)
+        self._directory = directory
+        self._worker_id = worker_id
+        # '<worker id>-<layer hash>.journal', so worker 'w' never takes the journals of 'w-2'
+        self._journal_name = re.compile(re.escape(worker_id) + r'-[0-9a-f]{32}\.journal')
+        self._files = dict()
+        self._open_entries = dict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def begin(self, tile_request: TileCreateRequest) -> str:
+        entry_id = uuid.uuid4().hex
+        layer = tile_request.get_directory_path()
+        with self._lock:
+            self._append(layer, {'op': 'begin', 'id': entry_id, 'request': tile_request.model_dump()})
+            self._open_entries[layer] = self._open_entries.get(layer, 0) + 1
+
+        return entry_id
+
+    def end(self, tile_request: TileCreateRequest, entry_id: str):
+        layer = tile_request.get_directory_path()
+        with self._lock:
+            self._append(layer, {'op': 'end', 'id': entry_id})
+            self._open_entries[layer] -= 1
+            journal = self._files[layer]
+            if self._open_entries[layer] == 0 and journal.tell() > _COMPACT_SIZE:
+                journal.truncate(0)
+                journal.seek(0)
+
+    def recover(self) -> List[TileCreateRequest]:
+        """
+        Removes the partial outputs of every journaled layer and returns the unfinished builds.
+        Must be called before any new build is journaled.
+        """
+        unfinished: dict[str, TileCreateRequest] = dict()
+        for name in os.listdir(self._directory):
+            if not self._journal_name.fullmatch(name):
+                continue
+
+            journal_path = os.path.join(self._directory, name)
+            layer, requests = self._read_journal(journal_path)
+            if layer:
+                self._remove_partial_outputs(layer)
+                self._remove_old_lossless_copies(layer)
+
+            for tile_request in requests:
+                if tile_request.exist():
+                    self._remove_stale_intermediates(tile_request)
+                else:
+                    unfinished[tile_request.get_tile_path()] = tile_request
+
+            os.remove(journal_path)
+
+        if unfinished:
+            self._logger.warning('Found %d unfinished tile build(s) in journal' % len(unfinished))
+
+        return list(unfinished.values())
+
+    def _read_journal(self, journal_path: str) -> tuple[str, List[TileCreateRequest]]:
+        layer = ''
+        begun: dict[str, dict] = dict()
+        with open(journal_path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last line may be cut by the crash
+                    continue
+
+                if record['op'] == 'layer':
+                    layer = record['directory']
+                elif record['op'] == 'begin':
+                    begun[record['id']] = record['request']
+                elif record['op'] == 'end':
+                    begun.pop(record['id'], None)
+
+        return layer, [TileCreateRequest(**request) for request in begun.values()]
+
+    def _remove_partial_outputs(self, layer: str):
+        partial_directory = layer + '/' + PARTIAL_DIRECTORY
+        if not os.path.isdir(partial_directory):
+            return
+
+        removed = 0
+        expired = time.time() - _PARTIAL_MAX_AGE_SECONDS
+        for name in os.listdir(partial_directory):
+            partial_path = os.path.join(partial_directory, name)
+            # Partial files are named '<worker id>-<uuid>', the ones of this worker are left by the crash
+            own = name.rsplit('-', 1)[0] == self._worker_id
+            try:
+                if own or os.path.getmtime(partial_path) < expired:
+                    os.remove(partial_path)
+                    removed += 1
+            except FileNotFoundError:
+                # Renamed into place by another worker meanwhile
+                continue
+
+        self._logger.info('Removed %d partial output(s) of %s' % (removed, layer))
+
+    def _remove_old_lossless_copies(self, layer: str):
+        removed = 0
+        expired = time.time() - _LOSSLESS_MAX_AGE_SECONDS
+        for directory, _, names in os.walk(layer + '/' + LOSSLESS_DIRECTORY):
+            for name in names:
+                lossless_tile_path = os.path.join(directory, name)
+                try:
+                    if os.path.getmtime(lossless_tile_path) < expired:
+                        os.remove(lossless_tile_path)
+                        removed += 1
+                except FileNotFoundError:
+                    continue
+
+        if removed:
+            self._logger.info('Removed %d old lossless tile(s) of %s' % (removed, layer))
+
+    @staticmethod
+    def _remove_stale_intermediates(tile_request: TileCreateRequest):
+        # A crash between writing a tile and removing its file tiles (or the lossless copies of its children)
+        # leaves them behind
+        for file in tile_request.files:
+            if tile_request.exist_file_tile(file):
+                os.remove(tile_request.get_file_tile_path(file))
+
+        for child in tile_request.get_children():
+            lossless_tile_path = child.get_lossless_tile_path()
+            if os.path.exists(lossless_tile_path):
+                os.remove(lossless_tile_path)
+
+    def _append(self, layer: str, record: dict):
+        journal = self._files.get(layer)
+        if journal is None:
+            layer_hash = hashlib.blake2b(layer.encode('utf-8'), digest_size=16).hexdigest()
+            name = '%s-%s.journal' % (self._worker_id, layer_hash)
+            journal = open(os.path.join(self._directory, name), 'a')
+            self._files[layer] = journal
+
+        if journal.tell() == 0:
+            journal.write(json.dumps({'op': 'layer', 'directory': layer}) + '\n')
+
+        journal.write(json.dumps(record) + '\n')
+        # Flushed to the OS, so the journal survives the process being killed
+        journal.flush()
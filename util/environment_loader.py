@@ -1,5 +1,10 @@
 import logging
+import socket
 
+from model.gdal_config import GdalConfig
+from model.http_config import HttpConfig
+from model.memory_config import MemoryConfig
+from model.pipeline_config import PipelineConfig
 from model.rabbit_config import RabbitConfig
 from dotenv import load_dotenv
 import os
@@ -20,6 +25,7 @@ def load_rabbit_config() -> RabbitConfig:
     config.connection_attempts = int(os.environ.get('RABBIT_CONNECTION_ATTEMPTS'))
     config.retry_delay = int(os.environ.get('RABBIT_RETRY_DELAY'))
     config.socket_timeout = int(os.environ.get('RABBIT_SOCKET_TIMEOUT'))
+    config.prefetch_count = int(os.environ.get('RABBIT_PREFETCH_COUNT', config.prefetch_count))
 
     return config
 
@@ -32,9 +38,71 @@ def load_upload_base_directory() -> str:
     return str(os.environ.get('UPLOAD_BASE_DIRECTORY'))
 
 
+def load_build_journal_directory() -> str:
+    return str(os.environ.get('BUILD_JOURNAL_DIRECTORY', load_base_directory() + '/.journal'))
+
+
+def load_worker_id() -> str:
+    return str(os.environ.get('WORKER_ID', socket.gethostname()))
+
+
 def load_app_version() -> str:
     return str(os.environ.get('VERSION'))
 
 
 def load_create_tile_count_per_request() -> int:
     return int(os.environ.get('CREATE_TILE_COUNT_PER_REQUEST'))
+
+
+def load_request_latency_target_ms() -> int:
+    return int(os.environ.get('TILE_REQUEST_LATENCY_TARGET_MS', 2000))
+
+
+def load_queue_depth_scale() -> int:
+    return int(os.environ.get('TILE_QUEUE_DEPTH_SCALE', 10))
+
+
+def load_pipeline_config() -> PipelineConfig:
+    config = PipelineConfig()
+    config.queue_size = int(os.environ.get('TILE_PIPELINE_QUEUE_SIZE', config.queue_size))
+    config.read_workers = int(os.environ.get('TILE_PIPELINE_READ_WORKERS', config.read_workers))
+    config.write_workers = int(os.environ.get('TILE_PIPELINE_WRITE_WORKERS', config.write_workers))
+    config.cpu_workers = int(os.environ.get('TILE_PIPELINE_CPU_WORKERS', os.cpu_count() or config.cpu_workers))
+    config.parallel_file_tiles = str(os.environ.get('TILE_PARALLEL_FILE_TILES',
+                                                    config.parallel_file_tiles)).lower() == 'true'
+
+    return config
+
+
+def load_http_config() -> HttpConfig:
+    config = HttpConfig()
+    config.enabled = str(os.environ.get('TILE_HTTP_ENABLED', config.enabled)).lower() == 'true'
+    config.host = str(os.environ.get('TILE_HTTP_HOST', config.host))
+    config.port = int(os.environ.get('TILE_HTTP_PORT', config.port))
+    config.cache_bytes = int(os.environ.get('TILE_HTTP_CACHE_BYTES', config.cache_bytes))
+    config.render_timeout_ms = int(os.environ.get('TILE_HTTP_RENDER_TIMEOUT_MS', config.render_timeout_ms))
+    config.layers_directory = str(os.environ.get('TILE_HTTP_LAYERS_DIRECTORY', load_base_directory()))
+
+    return config
+
+
+def load_gdal_config() -> GdalConfig:
+    config = GdalConfig()
+    config.worker_count = int(os.environ.get('GDAL_WORKER_COUNT', config.worker_count))
+    config.cache_fraction = float(os.environ.get('GDAL_CACHE_FRACTION', config.cache_fraction))
+    config.vsi_cache_fraction = float(os.environ.get('GDAL_VSI_CACHE_FRACTION', config.vsi_cache_fraction))
+    config.max_preread_bytes = int(os.environ.get('GDAL_MAX_PREREAD_BYTES', config.max_preread_bytes))
+
+    return config
+
+
+def load_memory_config() -> MemoryConfig:
+    config = MemoryConfig()
+    config.rss_limit_bytes = int(os.environ.get('MEMORY_RSS_LIMIT_MB', 0)) * 1024 * 1024
+    config.soft_fraction = float(os.environ.get('MEMORY_SOFT_FRACTION', config.soft_fraction))
+    config.eviction_interval_seconds = int(os.environ.get('MEMORY_EVICTION_INTERVAL_SECONDS',
+                                                          config.eviction_interval_seconds))
+    config.max_pause_seconds = int(os.environ.get('MEMORY_MAX_PAUSE_SECONDS', config.max_pause_seconds))
+    config.tile_creator_cache_size = int(os.environ.get('TILE_CREATOR_CACHE_SIZE', config.tile_creator_cache_size))
+
+    return config
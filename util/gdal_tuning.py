@@ -0,0 +1,49 @@
+import logging
+import os
+
+from osgeo import gdal
+
+from model.gdal_config import GdalConfig
+
+_CGROUP_MEMORY_LIMITS = ['/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes']
+
+
+def get_host_memory_bytes() -> int:
+    """Memory available to this container: the cgroup limit when there is one, the physical memory otherwise"""
+    physical = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    for limit_path in _CGROUP_MEMORY_LIMITS:
+        try:
+            with open(limit_path, 'r') as f:
+                limit = f.read().strip()
+        except OSError:
+            continue
+
+        if limit.isdigit():
+            return min(int(limit), physical)
+
+    return physical
+
+
+def configure_gdal(config: GdalConfig):
+    logger = logging.getLogger(__name__)
+
+    worker_count = max(config.worker_count, 1)
+    worker_memory = get_host_memory_bytes() // worker_count
+    cache_bytes = int(worker_memory * config.cache_fraction)
+    vsi_cache_bytes = int(worker_memory * config.vsi_cache_fraction)
+    threads = max((os.cpu_count() or 1) // worker_count, 1)
+
+    gdal.SetCacheMax(cache_bytes)
+    gdal.SetConfigOption('VSI_CACHE', 'TRUE')
+    gdal.SetConfigOption('VSI_CACHE_SIZE', str(vsi_cache_bytes))
+    gdal.SetConfigOption('GDAL_NUM_THREADS', str(threads))
+
+    logger.info('GDAL configured for %d worker(s): block cache %d MB, VSI cache %d MB, %d thread(s)' %
+                (worker_count, cache_bytes // (1024 * 1024), vsi_cache_bytes // (1024 * 1024), threads))
+
+
+def flush_gdal_cache():
+    """Lowering the cache size makes GDAL drop blocks until it fits, then the size is restored"""
+    cache_max = gdal.GetCacheMax()
+    gdal.SetCacheMax(0)
+    gdal.SetCacheMax(cache_max)
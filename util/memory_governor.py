@@ -0,0 +1,141 @@
+import ctypes
+import gc
+import logging
+import os
+import threading
+import time
+from typing import Callable
+
+from PIL.Image import Image as PngImage
+
+from model.memory_config import MemoryConfig
+from model.memory_stats import MemoryStats
+from util.environment_loader import load_memory_config, load_gdal_config
+from util.gdal_tuning import get_host_memory_bytes
+
+
+class MemoryGovernor:
+    """
+    Tracks live image buffers, dataset handles and cache sizes against an RSS ceiling.
+    Above the soft limit the registered caches are evicted; above the ceiling consumption should pause.
+    """
+    _config: MemoryConfig
+    _caches: dict[str, tuple[Callable[[], int], Callable[[], None] | None]]
+    _stats: MemoryStats
+    _lock: threading.Lock
+    _last_log: float = 0.0
+    _last_eviction: float = 0.0
+    _logger: logging.Logger
+
+    def __init__(self, config: MemoryConfig):
+        self._logger = logging.getLogger(__name__)
+        self._config = config
+        self._caches = dict()
+        self._stats = MemoryStats()
+        self._lock = threading.Lock()
+        self._stats.limit_bytes = config.rss_limit_bytes or \
+            int(get_host_memory_bytes() * 0.8 / max(load_gdal_config().worker_count, 1))
+
+    def register_cache(self, name: str, size: Callable[[], int], evict: Callable[[], None] | None = None):
+        """Caches without evict are only reported"""
+        self._caches[name] = (size, evict)
+
+    def track_image(self, image: PngImage) -> PngImage:
+        with self._lock:
+            self._stats.image_buffers += 1
+            self._stats.image_bytes += self._get_image_bytes(image)
+            self._stats.peak_image_bytes = max(self._stats.peak_image_bytes, self._stats.image_bytes)
+        return image
+
+    def close_image(self, image: PngImage):
+        with self._lock:
+            self._stats.image_buffers -= 1
+            self._stats.image_bytes -= self._get_image_bytes(image)
+        image.close()
+
+    def dataset_opened(self):
+        with self._lock:
+            self._stats.datasets += 1
+            self._stats.peak_datasets = max(self._stats.peak_datasets, self._stats.datasets)
+
+    def dataset_closed(self):
+        with self._lock:
+            self._stats.datasets -= 1
+
+    def is_under_pressure(self) -> bool:
+        """Evicts caches above the soft limit, returns True while the ceiling is still exceeded"""
+        rss = self._update_rss()
+        # Rate limited, the caches are refilled by the next requests while memory stays above the soft limit
+        if rss >= self._stats.limit_bytes * self._config.soft_fraction and \
+                time.time() - self._last_eviction >= self._config.eviction_interval_seconds:
+            self._last_eviction = time.time()
+            self._evict_caches()
+            rss = self._update_rss()
+
+        under_pressure = rss >= self._stats.limit_bytes
+        if under_pressure or time.time() - self._last_log > 60:
+            self._last_log = time.time()
+            self._logger.info('Memory %s' % self.get_stats())
+
+        return under_pressure
+
+    def wait_for_memory(self, sleep: Callable[[float], None]) -> bool:
+        """Waits (at most max_pause_seconds) until the ceiling is no longer exceeded"""
+        if not self.is_under_pressure():
+            return False
+
+        self._stats.pauses += 1
+        self._logger.warning('Memory ceiling exceeded, pausing consumption ...')
+        paused = time.time()
+        while self.is_under_pressure() and time.time() - paused < self._config.max_pause_seconds:
+            sleep(1)
+
+        return True
+
+    def get_stats(self) -> MemoryStats:
+        self._stats.cache_sizes = {name: size() for name, (size, _) in self._caches.items()}
+        return self._stats
+
+    def _evict_caches(self):
+        evictable = [name for name, (_, evict) in self._caches.items() if evict is not None]
+        self._logger.info('Memory above soft limit, evicting caches: %s' % ', '.join(evictable))
+        for name in evictable:
+            self._caches[name][1]()
+
+        self._stats.evictions += 1
+        gc.collect()
+        self._trim_heap()
+
+    def _update_rss(self) -> int:
+        rss = self._get_rss_bytes()
+        self._stats.rss_bytes = rss
+        self._stats.peak_rss_bytes = max(self._stats.peak_rss_bytes, rss, self._get_peak_rss_bytes())
+        return rss
+
+    @staticmethod
+    def _get_rss_bytes() -> int:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+    @staticmethod
+    def _get_peak_rss_bytes() -> int:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+        return 0
+
+    @staticmethod
+    def _trim_heap():
+        # Freed Python and GDAL memory stays in the glibc heap until it is trimmed
+        try:
+            ctypes.CDLL('libc.so.6').malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
+
+    @staticmethod
+    def _get_image_bytes(image: PngImage) -> int:
+        return image.width * image.height * len(image.getbands())
+
+
+memory_governor = MemoryGovernor(load_memory_config())
@@ -0,0 +1,104 @@
+import threading
+from typing import TYPE_CHECKING
+
+import numpy
+
+if TYPE_CHECKING:
+    from osgeo_utils.gdal2tiles import TileDetail
+
+
+class NumpyResampler:
+    """
+    Vectorized replacement of the MEM dataset + RegenerateOverview/ReprojectImage scaling for 8-bit tiles
+    whose query size is an integer multiple of the tile size.
+    Every band, alpha included, is reduced on its own like GDAL does, so the tiles are the same whichever path
+    created them.
+    """
+    SUPPORTED_RESAMPLINGS = ('average', 'near', 'mode', 'max', 'min')
+
+    _scratch: threading.local
+
+    def __init__(self):
+        # The render stage runs on several threads, each one keeps its own buffers
+        self._scratch = threading.local()
+
+    def resample(self, data: bytes, alpha: bytes, tile_detail: 'TileDetail', data_bands_count: int, tile_size: int,
+                 resampling: str) -> bytes | None:
+        """Returns the band sequential tile buffer (data bands + alpha), or None when GDAL must be used"""
+        query_size = tile_detail.querysize
+        if resampling not in self.SUPPORTED_RESAMPLINGS or query_size % tile_size != 0:
+            return None
+
+        window_pixels = tile_detail.wxsize * tile_detail.wysize
+        if len(data) != window_pixels * data_bands_count or len(alpha) != window_pixels:
+            # Not a Byte raster
+            return None
+
+        factor = query_size // tile_size
+        query = self._get_query_buffer(data_bands_count + 1, query_size)
+        query.fill(0)
+        wy, wx = tile_detail.wy, tile_detail.wx
+        query[:data_bands_count, wy:wy + tile_detail.wysize, wx:wx + tile_detail.wxsize] = numpy.frombuffer(
+            data, numpy.uint8).reshape(data_bands_count, tile_detail.wysize, tile_detail.wxsize)
+        query[data_bands_count, wy:wy + tile_detail.wysize, wx:wx + tile_detail.wxsize] = numpy.frombuffer(
+            alpha, numpy.uint8).reshape(tile_detail.wysize, tile_detail.wxsize)
+
+        # (bands, tile row, row in block, tile column, column in block)
+        blocks = query.reshape(data_bands_count + 1, tile_size, factor, tile_size, factor)
+
+        if resampling == 'near':
+            # Pixel under the centre of each block, as ReprojectImage picks it
+            tile = query[:, factor // 2::factor, factor // 2::factor]
+        elif resampling == 'average':
+            tile = self._average(blocks, factor)
+        elif resampling == 'mode':
+            tile = self._mode(blocks, factor)
+        else:
+            tile = self._extreme(blocks, resampling == 'max')
+
+        return numpy.ascontiguousarray(tile, dtype=numpy.uint8).tobytes()
+
+    def _get_query_buffer(self, bands: int, query_size: int) -> numpy.ndarray:
+        key = (bands, query_size)
+        buffers = getattr(self._scratch, 'buffers', None)
+        if buffers is None:
+            buffers = self._scratch.buffers = dict()
+
+        buffer = buffers.get(key)
+        if buffer is None:
+            buffer = buffers[key] = numpy.zeros((bands, query_size, query_size), numpy.uint8)
+
+        return buffer
+
+    @staticmethod
+    def _average(blocks: numpy.ndarray, factor: int) -> numpy.ndarray:
+        pixels = factor * factor
+        # Rounded like RegenerateOverview does for integer bands
+        return (blocks.sum(axis=(2, 4), dtype=numpy.uint32) + pixels // 2) // pixels
+
+    @staticmethod
+    def _extreme(blocks: numpy.ndarray, maximum: bool) -> numpy.ndarray:
+        reduce = numpy.max if maximum else numpy.min
+        return reduce(blocks, axis=(2, 4))
+
+    @staticmethod
+    def _mode(blocks: numpy.ndarray, factor: int) -> numpy.ndarray:
+        bands, tile_size = blocks.shape[0], blocks.shape[1]
+        pixels = factor * factor
+
+        # One row per (band, tile pixel) with the values of its block
+        rows = blocks.transpose(0, 1, 3, 2, 4).reshape(bands * tile_size * tile_size, pixels)
+        rows.sort(axis=1)
+        row_count = rows.shape[0]
+
+        run_ids = numpy.zeros(rows.shape, numpy.int64)
+        run_ids[:, 1:] = numpy.cumsum(rows[:, 1:] != rows[:, :-1], axis=1)
+        flat_ids = run_ids + (numpy.arange(row_count) * pixels)[:, None]
+        counts = numpy.bincount(flat_ids.ravel(), minlength=row_count * pixels).reshape(row_count, pixels)
+
+        run_values = numpy.zeros(rows.shape, numpy.uint8)
+        run_values[numpy.arange(row_count)[:, None], run_ids] = rows
+
+        # The first most frequent run, i.e. the smallest value on ties, as the GDAL warper picks it
+        best = counts.argmax(axis=1)
+        return run_values[numpy.arange(row_count), best].reshape(bands, tile_size, tile_size)
@@ -0,0 +1,86 @@
+import hashlib
+import os
+import uuid
+
+from osgeo import gdal
+from pyproj import Transformer
+
+from model.raster_fingerprint import RasterFingerprint
+
+FINGERPRINT_BLOCK_SIZE = 1024
+
+
+def get_fingerprint_path(raster_file_path: str) -> str:
+    return raster_file_path + '.fingerprint.json'
+
+
+def load_fingerprint(raster_file_path: str) -> RasterFingerprint | None:
+    fingerprint_path = get_fingerprint_path(raster_file_path)
+    if not os.path.exists(fingerprint_path):
+        return None
+
+    with open(fingerprint_path, 'r') as f:
+        return RasterFingerprint.model_validate_json(f.read())
+
+
+def save_fingerprint(raster_file_path: str, fingerprint: RasterFingerprint):
+    fingerprint_path = get_fingerprint_path(raster_file_path)
+    # Unique, as several workers may record the fingerprint of the same raster at the same time
+    temp_path = '%s.%s.temp' % (fingerprint_path, uuid.uuid4().hex)
+    with open(temp_path, 'w') as f:
+        f.write(fingerprint.model_dump_json())
+    os.replace(temp_path, fingerprint_path)
+
+
+def compute_fingerprint(raster_file_path: str) -> RasterFingerprint:
+    ds = gdal.Open(raster_file_path, gdal.GA_ReadOnly)
+
+    fingerprint = RasterFingerprint()
+    fingerprint.width = ds.RasterXSize
+    fingerprint.height = ds.RasterYSize
+    fingerprint.bandCount = ds.RasterCount
+    fingerprint.geoTransform = list(ds.GetGeoTransform())
+    fingerprint.projection = ds.GetProjection()
+    fingerprint.blockSize = FINGERPRINT_BLOCK_SIZE
+
+    checksums = []
+    for block_y in range(fingerprint.get_block_count_y()):
+        for block_x in range(fingerprint.get_block_count_x()):
+            index = block_y * fingerprint.get_block_count_x() + block_x
+            x, y, width, height = fingerprint.get_block_window(index)
+            data = ds.ReadRaster(x, y, width, height)
+            checksums.append(hashlib.blake2b(data, digest_size=16).hexdigest())
+
+    fingerprint.checksums = checksums
+    del ds
+
+    return fingerprint
+
+
+def get_window_mercator_bounds(fingerprint: RasterFingerprint,
+                               window: tuple[int, int, int, int]) -> tuple[float, float, float, float]:
+    """Returns [min_x, min_y, max_x, max_y] of a pixel window in EPSG:3857"""
+    gt = fingerprint.geoTransform
+    x, y, width, height = window
+    corners = [(x, y), (x + width, y), (x, y + height), (x + width, y + height)]
+    geo_x = [gt[0] + px * gt[1] + py * gt[2] for px, py in corners]
+    geo_y = [gt[3] + px * gt[4] + py * gt[5] for px, py in corners]
+
+    transformer = Transformer.from_crs(fingerprint.projection, 'epsg:3857', always_xy=True)
+    return transformer.transform_bounds(min(geo_x), min(geo_y), max(geo_x), max(geo_y))
+
+
+def get_changed_mercator_bounds(old: RasterFingerprint | None,
+                                new: RasterFingerprint) -> list[tuple[float, float, float, float]]:
+    """
+    Bounds (EPSG:3857) of the regions that differ between two fingerprints.
+    If the raster grid changed, the whole old and new extents are returned.
+    """
+    if old is not None and old.is_compatible(new):
+        return [get_window_mercator_bounds(new, window) for window in new.get_changed_windows(old)]
+
+    bounds = [get_window_mercator_bounds(new, (0, 0, new.width, new.height))]
+    if old is not None and old.projection:
+        bounds.append(get_window_mercator_bounds(old, (0, 0, old.width, old.height)))
+
+    return bounds
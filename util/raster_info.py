@@ -4,6 +4,7 @@ from rasterio import DatasetReader, CRS
 from rasterio.coords import BoundingBox
 import gdal2tiles as g2t
 from model.rabbit_message import LayerInfoRequest, LayerInfoResponse
+from util.memory_governor import memory_governor
 
 
 mercator = g2t.GlobalMercator()
@@ -11,7 +12,15 @@ mercator = g2t.GlobalMercator()
 
 # Max Boundary of EPSG:3857 is [-20037508.342789244, -20037508.342789244, 20037508.342789244, 20037508.342789244]
 def fetch_info(request: LayerInfoRequest) -> LayerInfoResponse:
-    raster_dataset: DatasetReader = rasterio.open(request.get_raster_file_path())
+    memory_governor.dataset_opened()
+    try:
+        with rasterio.open(request.get_raster_file_path()) as raster_dataset:
+            return _fetch_info(request, raster_dataset)
+    finally:
+        memory_governor.dataset_closed()
+
+
+def _fetch_info(request: LayerInfoRequest, raster_dataset: DatasetReader) -> LayerInfoResponse:
     raster_crs: CRS = raster_dataset.crs
 
     bounding_box: BoundingBox = raster_dataset.bounds
@@ -0,0 +1,182 @@
+import logging
+import time
+from typing import List
+
+import numpy
+from osgeo import gdal
+
+from model.file_tile_job import FileTileJob
+from model.preread_window import PrereadWindow
+from util.memory_governor import memory_governor
+
+# [first block x, first block y, last block x, last block y]
+BlockRange = tuple[int, int, int, int]
+
+
+class ReadPlanner:
+    """
+    Groups the jobs of a batch by the source blocks their windows touch.
+    Jobs sharing blocks get one pre-read window, so each block is decoded once instead of once per tile.
+    Planning only uses the block layout; the window is read in the read stage by the first job of its cluster.
+    The blocks are those of the dataset the tiles are read from, i.e. the temporary file of GDAL2Tiles: a warped
+    VRT (its own block layout, not the compressed blocks of the source GeoTIFF/COG) or a copy of the source.
+    """
+    _max_preread_bytes: int
+    # (block width, block height, raster width, raster height) by source, None when it is not a Byte raster
+    _layouts: dict[str, tuple[int, int, int, int] | None]
+    _last_log: float = 0.0
+    _logger: logging.Logger
+
+    # Totals since start, reported in the logs
+    pre_reads: int = 0
+    block_reads: int = 0
+    block_hits: int = 0
+
+    def __init__(self, max_preread_bytes: int):
+        self._logger = logging.getLogger(__name__)
+        self._max_preread_bytes = max_preread_bytes
+        self._layouts = dict()
+
+    def plan(self, jobs: List[FileTileJob]):
+        sources: dict[str, List[FileTileJob]] = dict()
+        for job in jobs:
+            sources.setdefault(job.tile_creator.tile_job_info.src_file, []).append(job)
+
+        for source, source_jobs in sources.items():
+            if len(source_jobs) > 1:
+                self._plan_source(source, source_jobs)
+
+        self._log_totals()
+
+    def read(self, job: FileTileJob) -> bool:
+        """
+        Fills the data and alpha of the job from its pre-read window, loading the window on first use.
+        Returns False when the job has to read from the source itself.
+        """
+        window, job.preread = job.preread, None
+        if window is None:
+            return False
+
+        try:
+            if not window.covers(job.tile_detail):
+                return False
+
+            with window.lock:
+                if window.data is None:
+                    self._load(window)
+
+            job.data, job.alpha = window.read(job.tile_detail)
+            return True
+        finally:
+            window.release()
+
+    def forget(self, source: str):
+        """Drops the block layout of a source which is not read anymore"""
+        self._layouts.pop(source, None)
+
+    def _plan_source(self, source: str, jobs: List[FileTileJob]):
+        layout = self._get_layout(source)
+        if layout is None:
+            return
+
+        block_width, block_height, raster_width, raster_height = layout
+        ranges: List[tuple[BlockRange, FileTileJob]] = []
+        for job in jobs:
+            detail = job.tile_detail
+            if detail.rxsize == 0 or detail.rysize == 0 or detail.wxsize < detail.rxsize:
+                continue
+
+            ranges.append(((detail.rx // block_width, detail.ry // block_height,
+                            (detail.rx + detail.rxsize - 1) // block_width,
+                            (detail.ry + detail.rysize - 1) // block_height), job))
+
+        for cluster in self._cluster(ranges):
+            touches = sum((r[2] - r[0] + 1) * (r[3] - r[1] + 1) for r, _ in cluster)
+            blocks = set()
+            for r, _ in cluster:
+                blocks.update((x, y) for x in range(r[0], r[2] + 1) for y in range(r[1], r[3] + 1))
+
+            if len(cluster) < 2 or touches == len(blocks):
+                continue
+
+            x = min(r[0] for r, _ in cluster) * block_width
+            y = min(r[1] for r, _ in cluster) * block_height
+            width = min((max(r[2] for r, _ in cluster) + 1) * block_width, raster_width) - x
+            height = min((max(r[3] for r, _ in cluster) + 1) * block_height, raster_height) - y
+            bands_count = cluster[0][1].tile_creator.tile_job_info.nb_data_bands
+            if width * height * (bands_count + 1) > self._max_preread_bytes:
+                continue
+
+            window = PrereadWindow(source, x, y, width, height, bands_count, len(cluster))
+            for _, job in cluster:
+                job.preread = window
+
+            self.pre_reads += 1
+            self.block_reads += len(blocks)
+            self.block_hits += touches - len(blocks)
+            self._logger.debug('Planned %dx%d window of %s for %d tiles: %d block(s) instead of %d' %
+                               (width, height, source, len(cluster), len(blocks), touches))
+
+    def _get_layout(self, source: str) -> tuple[int, int, int, int] | None:
+        if source in self._layouts:
+            return self._layouts[source]
+
+        ds = gdal.Open(source, gdal.GA_ReadOnly)
+        band = ds.GetRasterBand(1)
+        layout = None
+        if band.DataType == gdal.GDT_Byte:
+            block_width, block_height = band.GetBlockSize()
+            layout = (block_width, block_height, ds.RasterXSize, ds.RasterYSize)
+
+        del ds
+        self._layouts[source] = layout
+        return layout
+
+    @staticmethod
+    def _load(window: PrereadWindow):
+        # Its own handle, as the reads of the other clusters run on other threads
+        ds = gdal.Open(window.source, gdal.GA_ReadOnly)
+        memory_governor.dataset_opened()
+        try:
+            data = ds.ReadRaster(window.x, window.y, window.width, window.height,
+                                 band_list=list(range(1, window.bands_count + 1)))
+            mask = ds.GetRasterBand(1).GetMaskBand().ReadRaster(window.x, window.y, window.width, window.height)
+        finally:
+            del ds
+            memory_governor.dataset_closed()
+
+        window.data = numpy.frombuffer(data, numpy.uint8).reshape(window.bands_count, window.height, window.width)
+        window.mask = numpy.frombuffer(mask, numpy.uint8).reshape(window.height, window.width)
+
+    def _log_totals(self):
+        if time.time() - self._last_log < 60:
+            return
+
+        self._last_log = time.time()
+        self._logger.info('Read planner totals: %d pre-read(s), %d block(s) read, %d block hit(s), '
+                          'GDAL cache used %d MB' %
+                          (self.pre_reads, self.block_reads, self.block_hits, gdal.GetCacheUsed() // (1024 * 1024)))
+
+    @staticmethod
+    def _cluster(ranges: List[tuple[BlockRange, FileTileJob]]) -> List[List[tuple[BlockRange, FileTileJob]]]:
+        """Jobs are in the same cluster when their block ranges share at least one block, directly or not"""
+        clusters: List[tuple[BlockRange, List[tuple[BlockRange, FileTileJob]]]] = []
+        for item in ranges:
+            bounds, members = item[0], [item]
+            merged = True
+            while merged:
+                merged = False
+                for cluster in clusters:
+                    other = cluster[0]
+                    if bounds[0] <= other[2] and other[0] <= bounds[2] and bounds[1] <= other[3] and \
+                            other[1] <= bounds[3]:
+                        bounds = (min(bounds[0], other[0]), min(bounds[1], other[1]),
+                                  max(bounds[2], other[2]), max(bounds[3], other[3]))
+                        members += cluster[1]
+                        clusters.remove(cluster)
+                        merged = True
+                        break
+
+            clusters.append((bounds, members))
+
+        return [members for _, members in clusters]
@@ -0,0 +1,81 @@
+from typing import Any, List
+
+# [min_x, min_y, max_x, max_y]
+Bounds = tuple[float, float, float, float]
+
+
+class _Node:
+    bounds: Bounds
+    children: list
+    values: list
+
+    def __init__(self, bounds: Bounds, children: list, values: list):
+        self.bounds = bounds
+        self.children = children
+        self.values = values
+
+
+class SpatialIndex:
+    """
+    Static R-tree packed with the Sort-Tile-Recursive algorithm.
+    It is built once from all items and answers bounding box queries in logarithmic time.
+    """
+    _root: _Node | None
+    _node_capacity: int
+    size: int
+
+    def __init__(self, items: List[tuple[Bounds, Any]], node_capacity: int = 16):
+        self._node_capacity = max(node_capacity, 2)
+        self.size = len(items)
+        self._root = None
+        if not items:
+            return
+
+        nodes = [_Node(bounds, [], [value]) for bounds, value in items]
+        while len(nodes) > 1:
+            nodes = self._pack(nodes)
+        self._root = nodes[0]
+
+    def query(self, bounds: Bounds) -> list:
+        """Values whose bounds intersect (or touch) the given bounds"""
+        if self._root is None:
+            return []
+
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if not self._intersects(node.bounds, bounds):
+                continue
+
+            if node.children:
+                stack.extend(node.children)
+            else:
+                found.extend(node.values)
+
+        return found
+
+    def _pack(self, nodes: List[_Node]) -> List[_Node]:
+        capacity = self._node_capacity
+        parent_count = (len(nodes) + capacity - 1) // capacity
+        slice_count = max(int(parent_count ** 0.5 + 0.999999), 1)
+        slice_size = slice_count * capacity
+
+        nodes = sorted(nodes, key=lambda n: n.bounds[0] + n.bounds[2])
+        parents = []
+        for i in range(0, len(nodes), slice_size):
+            vertical_slice = sorted(nodes[i:i + slice_size], key=lambda n: n.bounds[1] + n.bounds[3])
+            for j in range(0, len(vertical_slice), capacity):
+                children = vertical_slice[j:j + capacity]
+                parents.append(_Node(self._union([child.bounds for child in children]), children, []))
+
+        return parents
+
+    @staticmethod
+    def _union(bounds_list: List[Bounds]) -> Bounds:
+        return (min(b[0] for b in bounds_list), min(b[1] for b in bounds_list),
+                max(b[2] for b in bounds_list), max(b[3] for b in bounds_list))
+
+    @staticmethod
+    def _intersects(a: Bounds, b: Bounds) -> bool:
+        return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
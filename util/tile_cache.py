@@ -0,0 +1,66 @@
+import threading
+from collections import OrderedDict
+
+
+class CachedTile:
+    content: bytes
+    etag: str
+
+    def __init__(self, content: bytes, etag: str):
+        self.content = content
+        self.etag = etag
+
+
+class TileMemoryCache:
+    """LRU cache of encoded tiles keyed by tile path, bounded by the total size of the contents"""
+    _max_bytes: int
+    _entries: OrderedDict
+    _size: int = 0
+    _lock: threading.Lock
+    hits: int = 0
+    misses: int = 0
+
+    def __init__(self, max_bytes: int):
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> CachedTile | None:
+        with self._lock:
+            tile = self._entries.get(key)
+            if tile is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return tile
+
+    def put(self, key: str, tile: CachedTile):
+        if len(tile.content) > self._max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous.content)
+
+            self._entries[key] = tile
+            self._size += len(tile.content)
+            while self._size > self._max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.content)
+
+    def remove(self, key: str):
+        with self._lock:
+            tile = self._entries.pop(key, None)
+            if tile is not None:
+                self._size -= len(tile.content)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def get_size(self) -> int:
+        return self._size
@@ -1,221 +1,487 @@
 import logging
 import os
 import random
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
 
 import numpy
 from PIL.Image import Image as PngImage
 from PIL import Image as ImageUtil
-from gdal2tiles import GDAL2Tiles, TileJobInfo
+from gdal2tiles import GDAL2Tiles, TileJobInfo, GlobalMercator
 from osgeo import gdal
 import osgeo.gdal_array as gdalarray
 from osgeo_utils.gdal2tiles import numpy_available, TileDetail
 
+from model.file_tile_job import FileTileJob
 from model.gdal_2_tiles_options import GDAL2TilesOptions
+from model.layer_file_index import LayerFileIndex
 from model.rabbit_message import TileCreateRequest, FileTileCreate
+from model.request_budget import RequestBudget
 from model.tile_creator_instance import TileCreatorInstance
-from typing import List, Literal, Any
+from typing import List, Literal, Any, Callable
 
-from util.environment_loader import load_create_tile_count_per_request
+from util.build_journal import BuildJournal
+from util.environment_loader import load_create_tile_count_per_request, load_pipeline_config, \
+    load_request_latency_target_ms, load_queue_depth_scale, load_build_journal_directory, load_worker_id, \
+    load_gdal_config, load_memory_config
+from util.gdal_tuning import configure_gdal, flush_gdal_cache
+from util.memory_governor import memory_governor
+from util.numpy_resampler import NumpyResampler
+from util.read_planner import ReadPlanner
+from util.spatial_index import Bounds
+from util.tile_encoder import TileEncoder
+from util.tile_pipeline import TilePipeline
+from util.work_budget import WorkBudgetController
+
+mercator = GlobalMercator()
 
 
 class TileCreator:
     _gdal2tilesEntries: dict
-    _tile_creators: dict
+    _tile_creators: OrderedDict
+    _tile_creator_cache_size: int
+    # Footprint of each file name by layer directory, it only grows as files are opened
+    _layer_footprints: dict[str, dict[str, Bounds]]
+    _layer_file_indexes: dict[str, LayerFileIndex]
     _logger: logging.Logger
     _create_tile_count_per_request: int = 4
+    _pipeline: TilePipeline
+    _parallel_file_tiles: bool = True
+    work_budget: WorkBudgetController
+    # Called with the raster file path whenever a raster is opened for tiling
+    raster_opened_listener: Callable[[str], None] | None = None
+    _lock: threading.RLock
+    _worker_id: str
+    _journal: BuildJournal
+    _resampler: NumpyResampler
+    _read_planner: ReadPlanner
 
     def __init__(self):
         self._logger = logging.getLogger(__name__)
+        self._lock = threading.RLock()
         self._gdal2tilesEntries = dict()
-        self._tile_creators = dict()
+        self._tile_creators = OrderedDict()
+        self._tile_creator_cache_size = max(load_memory_config().tile_creator_cache_size, 1)
+        self._layer_footprints = dict()
+        self._layer_file_indexes = dict()
         self._create_tile_count_per_request = load_create_tile_count_per_request()
-
-    def create_tile(self, tile_request: TileCreateRequest):
-
+        self._pipeline = self._create_pipeline()
+        self.work_budget = WorkBudgetController(load_request_latency_target_ms(), load_queue_depth_scale())
+        self._worker_id = load_worker_id()
+        self._journal = BuildJournal(load_build_journal_directory(), self._worker_id)
+        self._resampler = NumpyResampler()
+
+        gdal_config = load_gdal_config()
+        configure_gdal(gdal_config)
+        self._read_planner = ReadPlanner(gdal_config.max_preread_bytes)
+
+        # Not evicted under memory pressure: the cache is bounded and opening a raster again copies or warps it
+        memory_governor.register_cache('tile_creators', lambda: len(self._tile_creators))
+        memory_governor.register_cache('gdal_block_cache_mb', lambda: gdal.GetCacheUsed() // (1024 * 1024),
+                                       flush_gdal_cache)
+
+    def _create_pipeline(self) -> TilePipeline:
+        config = load_pipeline_config()
+        self._parallel_file_tiles = config.parallel_file_tiles
+        pipeline = TilePipeline(config.queue_size)
+        pipeline.add_stage('read', self._read_file_tile, config.read_workers)
+        pipeline.add_stage('render', self._render_file_tile, config.cpu_workers)
+        pipeline.add_stage('encode', self._encode_file_tile, config.cpu_workers)
+        pipeline.add_stage('write', self._write_file_tile, config.write_workers)
+        return pipeline
+
+    def create_tile(self, tile_request: TileCreateRequest) -> bool:
+        """Returns True when the budget ran out before the tile was completed and a follow-up is needed"""
+        # Called from both the Rabbit consumer and the HTTP server threads
+        with self._lock:
+            return self._create_tile(tile_request)
+
+    def recover_unfinished_builds(self) -> List[TileCreateRequest]:
+        """Cleans the outputs of builds interrupted by a crash and returns them to be requested again"""
+        with self._lock:
+            return self._journal.recover()
+
+    def _create_tile(self, tile_request: TileCreateRequest) -> bool:
         tile_path = tile_request.get_tile_path()
 
         if os.path.exists(tile_path):
-            return
+            return False
 
         self._logger.debug('<<<<<< Request for create tile: %s >>>>>>' % tile_request.get_tile_path())
+        # Once per request, the tiles of the subtree only query the index
+        self._get_layer_file_index(tile_request, True)
         self._remove_empty_files(tile_request)
 
-        if tile_request.z >= tile_request.startCreateTileZoom:
-            self._create_tile_by_origin_file(tile_request, self._create_tile_count_per_request)
-        else:
-            self._create_tile_by_child(tile_request, self._create_tile_count_per_request)
+        budget = self.work_budget.new_budget(self._create_tile_count_per_request)
+        entry_id = self._journal.begin(tile_request)
+        try:
+            if tile_request.z >= tile_request.startCreateTileZoom:
+                self._create_tile_by_origin_file(tile_request, budget)
+            else:
+                self._create_tile_by_child(tile_request, budget)
+        finally:
+            self._journal.end(tile_request, entry_id)
+
+        self._logger.debug('Created %d file tile(s) in %.1fms (queue depth: %d)' %
+                           (budget.created_tiles, budget.elapsed_ms(), self.work_budget.get_queue_depth()))
+        return budget.skipped and not tile_request.exist()
+
+    def evict_raster(self, raster_file_path: str):
+        """Drops the cached GDAL2Tiles instance of a raster, so a replaced file is opened again"""
+        with self._lock:
+            instance = self._tile_creators.pop(raster_file_path, None)
+            if instance is not None:
+                self._drop_tile_creator(instance)
+                self._logger.debug('Evicted tile creator instance of %s' % raster_file_path)
+
+            # Only the footprint of the updated file is dropped, the R-tree is built again from the others
+            for directory, footprints in self._layer_footprints.items():
+                if raster_file_path.startswith(directory + '/'):
+                    footprints.pop(raster_file_path[len(directory) + 1:], None)
+                    self._layer_file_indexes.pop(directory, None)
+
+    def get_max_zoom(self, tile_request: TileCreateRequest, file: FileTileCreate) -> int:
+        """Deepest zoom the tiles of the raster are created for"""
+        with self._lock:
+            return self._get_file_tile_creator_instance(tile_request, file).tile_job_info.tmaxz
+
+    def _drop_tile_creator(self, instance: TileCreatorInstance):
+        self._read_planner.forget(instance.tile_job_info.src_file)
+        instance.dropped = True
+        if instance.in_flight == 0:
+            self._remove_tile_creator_files(instance)
+
+    def _release_tile_creator(self, instance: TileCreatorInstance):
+        instance.in_flight -= 1
+        if instance.dropped and instance.in_flight == 0:
+            self._remove_tile_creator_files(instance)
+
+    def _remove_tile_creator_files(self, instance: TileCreatorInstance):
+        # GDAL2Tiles never removes its temporary directory, which holds a copy or a warped VRT of the raster
+        self._logger.debug('Removing temporary directory of %s' % instance.key)
+        shutil.rmtree(instance.gdal2tiles.tmp_dir, ignore_errors=True)
+
+    def _create_tile_by_child(self, tile_request: TileCreateRequest, budget: RequestBudget):
+        if tile_request.exist() or not tile_request.files:
+            return
 
-    def _create_tile_by_child(self, tile_request: TileCreateRequest, max_create_tile: int) -> int:
-        if tile_request.exist() or not tile_request.files or max_create_tile <= 0:
-            return 0
+        if budget.is_exhausted():
+            budget.skipped = True
+            return
 
-        created_tiles = 0
         children = tile_request.get_children()
         random.shuffle(children)
+        origin_children: List[TileCreateRequest] = []
         for child in children:
             self._remove_empty_files(child)
             if not child.files:
                 continue
 
             if child.z >= child.startCreateTileZoom:
-                created_tiles += self._create_tile_by_origin_file(child, max_create_tile - created_tiles)
+                origin_children.append(child)
             else:
-                created_tiles += self._create_tile_by_child(child, max_create_tile - created_tiles)
-
-        self._create_tile_if_child_exists(tile_request)
-        return created_tiles
-
-    def _create_tile_by_origin_file(self, tile_request: TileCreateRequest, max_create_tile: int) -> int:
-        if tile_request.exist():
-            return 0
-
-        if not tile_request.files:
-            return 0
-
-        created_tiles = 0
-        for file in tile_request.files:
-            if tile_request.exist_file_tile(file):
-                continue
-
-            if self._is_empty_file_tile(tile_request, file):
-                continue
+                self._create_tile_by_child(child, budget)
 
-            if created_tiles >= max_create_tile:
-                return created_tiles
+        # Sibling file tiles are rendered together in one pipeline batch
+        self._create_tiles_by_origin_file(origin_children, budget)
 
-            self._create_file_tile_by_origin_file(tile_request, file)
-            created_tiles += 1
+        self._create_tile_if_child_exists(tile_request)
 
-        self._create_tile_if_file_tiles_exist(tile_request)
+    def _create_tile_by_origin_file(self, tile_request: TileCreateRequest, budget: RequestBudget):
+        self._create_tiles_by_origin_file([tile_request], budget)
+
+    def _create_tiles_by_origin_file(self, tile_requests: List[TileCreateRequest], budget: RequestBudget):
+        jobs: List[FileTileJob] = []
+        pending: List[tuple[TileCreateRequest, bool]] = []
+        try:
+            for tile_request in tile_requests:
+                if tile_request.exist():
+                    continue
+
+                if not tile_request.files:
+                    continue
+
+                reached_limit = False
+                for file in tile_request.files:
+                    if tile_request.exist_file_tile(file):
+                        continue
+
+                    if self._is_empty_file_tile(tile_request, file):
+                        continue
+
+                    job = self._new_file_tile_job(tile_request, file)
+                    if not budget.try_reserve(self.work_budget.estimate_ms(job.tile_creator.key)):
+                        reached_limit = True
+                        break
+
+                    jobs.append(job)
+                    # Counted until the batch is finished, an instance may be dropped by the LRU while building it
+                    job.tile_creator.in_flight += 1
+
+                pending.append((tile_request, reached_limit))
+        except BaseException:
+            # Released by _run_file_tile_jobs otherwise
+            for job in jobs:
+                self._release_tile_creator(job.tile_creator)
+            raise
+
+        self._run_file_tile_jobs(jobs)
+        budget.commit()
+
+        # Composited in 'files' order, whatever order the file tiles were finished in
+        for tile_request, reached_limit in pending:
+            if not reached_limit:
+                self._create_tile_if_file_tiles_exist(tile_request)
+
+    def _run_file_tile_jobs(self, jobs: List[FileTileJob]):
+        if not jobs:
+            return
 
-        return created_tiles
+        started = time.perf_counter()
+        try:
+            self._read_planner.plan(jobs)
+            if self._parallel_file_tiles:
+                self._pipeline.run(jobs)
+            else:
+                for job in jobs:
+                    self._pipeline.run([job])
+        finally:
+            for job in jobs:
+                self._release_tile_creator(job.tile_creator)
+
+        # Jobs overlap in the pipeline, so each one is charged its share of the batch time
+        job_ms = (time.perf_counter() - started) * 1000 / len(jobs)
+        for job in jobs:
+            self.work_budget.record(job.tile_creator.key, job_ms)
+        self._pipeline.log_stats()
 
     def _create_tile_if_child_exists(self, tile_request: TileCreateRequest):
         if tile_request.exist():
             return
 
+        # From startCreateTileZoom on, lossy children are not composited: the tile is rendered from the origin
+        # files when it is requested
+        if tile_request.z >= tile_request.startCreateTileZoom and not tile_request.encoding.is_lossless():
+            return
+
         children: List[TileCreateRequest] = tile_request.get_children()
         images = []
-        for child in children:
-            image = self._get_tile_image_if_exists(child)
-            if image is None:
-                return
+        try:
+            for child in children:
+                image = self._get_tile_image_if_exists(child)
+                if image is None:
+                    return
 
-            images.append(image)
+                images.append(image)
 
-        tile_image = self._concat_images_and_resize(images, tile_request.startPoint, tile_request.resampling)
+            tile_image = self._concat_images_and_resize(images, tile_request.startPoint, tile_request.resampling)
+        finally:
+            # Closed before going up to the parent, so each level does not keep its children buffers
+            for image in images:
+                memory_governor.close_image(image)
+
+        self._logger.debug('Creating tile by children: %s' % tile_request.get_tile_path())
+        # Journaled, so the lossless copies of the children are removed if the worker dies in between
+        entry_id = self._journal.begin(tile_request)
+        try:
+            self._write_final_tile(tile_request, tile_image)
+            tile_image.close()
+
+            for child in children:
+                lossless_tile_path = child.get_lossless_tile_path()
+                if os.path.exists(lossless_tile_path):
+                    os.remove(lossless_tile_path)
+        finally:
+            self._journal.end(tile_request, entry_id)
 
-        tile_path = tile_request.get_tile_path()
-        self._logger.debug('Creating tile by children: %s' % tile_path)
-        os.makedirs(os.path.dirname(tile_path), exist_ok=True)
-        tile_image.save(tile_path, format="png")
-        tile_image.close()
         parent = tile_request.get_parent()
         self._create_tile_if_child_exists(parent)
 
     def _get_file_tile_image_if_exists(self, child: TileCreateRequest, file: FileTileCreate) -> PngImage | None:
         file_tile_path = child.get_file_tile_path(file)
         if os.path.exists(file_tile_path):
-            return ImageUtil.open(file_tile_path)
+            return memory_governor.track_image(ImageUtil.open(file_tile_path))
 
         if self._is_empty_file_tile(child, file):
-            return self._get_transparent_tile()
+            return memory_governor.track_image(self._get_transparent_tile())
 
         return None
 
     def _get_tile_image_if_exists(self, tile_request: TileCreateRequest) -> PngImage | None:
         if tile_request.exist():
-            return ImageUtil.open(tile_request.get_tile_path())
+            # The lossless copy, so lossy artefacts are not compounded up the pyramid
+            tile_path = tile_request.get_lossless_tile_path()
+            if not os.path.exists(tile_path):
+                tile_path = tile_request.get_tile_path()
+            return memory_governor.track_image(ImageUtil.open(tile_path))
 
         if self._is_empty_tile(tile_request):
-            return self._get_transparent_tile()
+            return memory_governor.track_image(self._get_transparent_tile())
 
         return None
 
-    def _create_file_tile_by_origin_file(self, tile_request: TileCreateRequest, file_tile: FileTileCreate):
-        tile_file_path = tile_request.get_file_tile_path(file_tile)
-        if self._is_empty_file_tile(tile_request, file_tile):
-            return
-
-        self._logger.debug('Creating file tile by origin: %s' % tile_file_path)
+    def _new_file_tile_job(self, tile_request: TileCreateRequest, file_tile: FileTileCreate) -> FileTileJob:
+        # GDAL2Tiles instances are shared, so everything touching them is done before entering the pipeline
         tile_creator = self._get_file_tile_creator_instance(tile_request, file_tile)
+        tile_detail = self._get_tile_detail(tile_creator.gdal2tiles, tile_request)
+        return FileTileJob(tile_request, file_tile, tile_creator, tile_detail)
 
-        tile_job_info = tile_creator.tile_job_info
+    def _read_file_tile(self, job: FileTileJob) -> FileTileJob:
+        self._logger.debug('Creating file tile by origin: %s' % job.tile_file_path)
+        if self._read_planner.read(job):
+            return job
 
-        os.makedirs(os.path.dirname(tile_file_path), exist_ok=True)
+        tile_detail = job.tile_detail
+        if tile_detail.rxsize == 0 or tile_detail.rysize == 0 or tile_detail.wxsize == 0 or tile_detail.wysize == 0:
+            return job
 
-        tile_detail = self._get_tile_detail(tile_creator.gdal2tiles, tile_request)
+        data_bands_count = job.tile_creator.tile_job_info.nb_data_bands
+        # Each read opens its own handle, GDAL datasets must not be shared between threads
+        ds = gdal.Open(job.tile_creator.tile_job_info.src_file, gdal.GA_ReadOnly)
+        memory_governor.dataset_opened()
+        try:
+            alpha_band = ds.GetRasterBand(1).GetMaskBand()
+
+            job.alpha = alpha_band.ReadRaster(tile_detail.rx, tile_detail.ry, tile_detail.rxsize,
+                                              tile_detail.rysize, tile_detail.wxsize, tile_detail.wysize)
+
+            job.data = ds.ReadRaster(
+                tile_detail.rx, tile_detail.ry, tile_detail.rxsize, tile_detail.rysize,
+                tile_detail.wxsize, tile_detail.wysize, band_list=list(range(1, data_bands_count + 1)),
+            )
+        finally:
+            del ds
+            memory_governor.dataset_closed()
+
+        return job
+
+    def _render_file_tile(self, job: FileTileJob) -> FileTileJob:
+        tile_job_info = job.tile_creator.tile_job_info
+        tile_detail = job.tile_detail
 
         data_bands_count = tile_job_info.nb_data_bands
         tile_size = tile_job_info.tile_size
         options = tile_job_info.options
 
         tile_bands = data_bands_count + 1
-        ds = gdal.Open(tile_job_info.src_file, gdal.GA_ReadOnly)
 
         mem_drv = gdal.GetDriverByName("MEM")
-        out_drv = gdal.GetDriverByName(tile_job_info.tile_driver)
-        alpha_band = ds.GetRasterBand(1).GetMaskBand()
 
         # Tile dataset in memory
         tile_dataset = mem_drv.Create("", tile_size, tile_size, tile_bands)
 
-        data = alpha = None
-
-        if tile_detail.rxsize != 0 and tile_detail.rysize != 0 and tile_detail.wxsize != 0 and tile_detail.wysize != 0:
-            alpha = alpha_band.ReadRaster(tile_detail.rx, tile_detail.ry, tile_detail.rxsize, tile_detail.rysize,
-                                          tile_detail.wxsize, tile_detail.wysize)
-
-            data = ds.ReadRaster(
-                tile_detail.rx, tile_detail.ry, tile_detail.rxsize, tile_detail.rysize,
-                tile_detail.wxsize, tile_detail.wysize, band_list=list(range(1, data_bands_count + 1)),
-            )
-
-        if data:
+        if job.data:
             if tile_size == tile_detail.querysize:
                 # Use the ReadRaster result directly in tiles ('nearest neighbour' query)
                 tile_dataset.WriteRaster(
-                    tile_detail.wx, tile_detail.wy, tile_detail.wxsize, tile_detail.wysize, data,
+                    tile_detail.wx, tile_detail.wy, tile_detail.wxsize, tile_detail.wysize, job.data,
                     band_list=list(range(1, data_bands_count + 1)),
                 )
-                tile_dataset.WriteRaster(tile_detail.wx, tile_detail.wy, tile_detail.wxsize, tile_detail.wysize, alpha,
-                                         band_list=[tile_bands])
+                tile_dataset.WriteRaster(tile_detail.wx, tile_detail.wy, tile_detail.wxsize, tile_detail.wysize,
+                                         job.alpha, band_list=[tile_bands])
 
                 # Note: For source drivers based on WaveLet compression (JPEG2000, ECW,
                 # MrSID) the ReadRaster function returns high-quality raster (not ugly
                 # nearest neighbour)
                 # TODO: Use directly 'near' for WaveLet files
             else:
+                resampled = self._resampler.resample(job.data, job.alpha, tile_detail, data_bands_count, tile_size,
+                                                     options.resampling)
+                if resampled is not None:
+                    tile_dataset.WriteRaster(0, 0, tile_size, tile_size, resampled)
+                    job.data = job.alpha = None
+                    job.tile_dataset = tile_dataset
+                    return job
+
                 # Big ReadRaster query in memory scaled to the tile_size - all but 'near'
                 # algo
                 ds_query = mem_drv.Create("", tile_detail.querysize, tile_detail.querysize, tile_bands)
                 # TODO: fill the null value in case a tile without alpha is produced (now
                 # only png tiles are supported)
                 ds_query.WriteRaster(
-                    tile_detail.wx, tile_detail.wy, tile_detail.wxsize, tile_detail.wysize, data,
+                    tile_detail.wx, tile_detail.wy, tile_detail.wxsize, tile_detail.wysize, job.data,
                     band_list=list(range(1, data_bands_count + 1)),
                 )
                 ds_query.WriteRaster(
-                    tile_detail.wx, tile_detail.wy, tile_detail.wxsize, tile_detail.wysize, alpha,
+                    tile_detail.wx, tile_detail.wy, tile_detail.wxsize, tile_detail.wysize, job.alpha,
                     band_list=[tile_bands]
                 )
 
-                self._scale_query_to_tile(ds_query, tile_dataset, options, tile_file_path)
+                job.image = self._scale_query_to_tile(ds_query, tile_dataset, options, job.tile_file_path)
                 del ds_query
 
-        del data
+        job.data = job.alpha = None
+        job.tile_dataset = tile_dataset
+        return job
+
+    def _encode_file_tile(self, job: FileTileJob) -> FileTileJob:
+        if job.image is not None:
+            # 'antialias' resampling is scaled by PIL
+            job.encoded = TileEncoder.encode_intermediate(job.image, job.tile_request.encoding)
+            job.image.close()
+            job.image = None
+        else:
+            tile_driver = job.tile_creator.tile_job_info.tile_driver
+            creation_options = TileEncoder.get_gdal_creation_options(tile_driver, job.tile_request.encoding)
+            job.encoded = self._encode_dataset(job.tile_dataset, tile_driver, creation_options)
 
-        if options.resampling != "antialias":
-            # Write a copy of tile to png/jpg
-            out_drv.CreateCopy(tile_file_path, tile_dataset, strict=0, options=[])
+        job.tile_dataset = None
+        return job
 
-        del tile_dataset
+    def _write_file_tile(self, job: FileTileJob) -> FileTileJob:
+        self._write_tile(job.tile_request, job.tile_file_path, job.encoded)
+        job.encoded = None
+        return job
+
+    @staticmethod
+    def _encode_dataset(dataset, driver_name: str, creation_options: list[str]) -> bytes:
+        """Encodes the dataset in memory (/vsimem) so that encoding and disk write are separate stages"""
+        memory_path = '/vsimem/%s.tile' % uuid.uuid4().hex
+        out_drv = gdal.GetDriverByName(driver_name)
+        out_drv.CreateCopy(memory_path, dataset, strict=0, options=creation_options)
+        try:
+            size = gdal.VSIStatL(memory_path).size
+            file = gdal.VSIFOpenL(memory_path, 'rb')
+            encoded = gdal.VSIFReadL(1, size, file)
+            gdal.VSIFCloseL(file)
+        finally:
+            gdal.Unlink(memory_path)
+
+        return encoded
+
+    def _write_final_tile(self, tile_request: TileCreateRequest, tile_image: PngImage):
+        """
+        Writes the published tile. With a lossy profile a lossless copy is kept until the parent is composited,
+        for tiles whose parent is composited from its children (below startCreateTileZoom).
+        """
+        if 0 < tile_request.z <= tile_request.startCreateTileZoom and \
+                TileEncoder.is_lossy(tile_image, tile_request.encoding):
+            self._write_tile(tile_request, tile_request.get_lossless_tile_path(),
+                             TileEncoder.encode_intermediate(tile_image, tile_request.encoding))
+
+        self._write_tile(tile_request, tile_request.get_tile_path(),
+                         TileEncoder.encode(tile_image, tile_request.encoding))
+
+    def _write_tile(self, tile_request: TileCreateRequest, tile_path: str, encoded: bytes):
+        """Writes to the partial directory and renames, so a killed worker never leaves a truncated tile"""
+        os.makedirs(os.path.dirname(tile_path), exist_ok=True)
+        partial_directory = tile_request.get_partial_directory()
+        os.makedirs(partial_directory, exist_ok=True)
+        # Prefixed by the worker, so its own partial files are known after a restart
+        partial_path = '%s/%s-%s' % (partial_directory, self._worker_id, uuid.uuid4().hex)
+        with open(partial_path, 'wb') as file:
+            file.write(encoded)
+        os.replace(partial_path, tile_path)
 
     def _get_file_tile_creator_instance(self, tile_request: TileCreateRequest,
                                         file: FileTileCreate) -> TileCreatorInstance:
         raster_file_path = tile_request.get_raster_file_path(file)
         entry = self._tile_creators.get(raster_file_path)
         if entry:
+            self._tile_creators.move_to_end(raster_file_path)
             return entry
 
         self._logger.debug('Instance not found. exist instances are: ' + str(self._tile_creators.keys()))
@@ -233,6 +499,11 @@ class TileCreator:
 
         instance = TileCreatorInstance(raster_file_path, gdal_to_tiles, tile_job_info)
         self._tile_creators[raster_file_path] = instance
+        if self.raster_opened_listener is not None:
+            self.raster_opened_listener(raster_file_path)
+        while len(self._tile_creators) > self._tile_creator_cache_size:
+            # Least recently used first
+            self._drop_tile_creator(self._tile_creators.popitem(last=False)[1])
         return instance
 
     def _is_empty_file_tile(self, tile_request: TileCreateRequest, file: FileTileCreate) -> bool:
@@ -243,45 +514,75 @@ class TileCreator:
         return not (zoom_info[0] <= tms[1] <= zoom_info[2] and zoom_info[1] <= tms[2] <= zoom_info[3])
 
     def _is_empty_tile(self, tile_request: TileCreateRequest) -> bool:
-        for file in tile_request.files:
+        for file in self._get_intersecting_files(tile_request):
             if not self._is_empty_file_tile(tile_request, file):
                 return False
         return True
 
-    def _create_tile_if_file_tiles_exist(self, tile_request: TileCreateRequest):
-        if tile_request.exist():
-            return
+    def _get_intersecting_files(self, tile_request: TileCreateRequest) -> List[FileTileCreate]:
+        """Candidate files whose footprint touches the tile, the exact check is still done by tminmax"""
+        index = self._get_layer_file_index(tile_request)
+        tms = tile_request.get_tms_position()
+        return index.query(mercator.TileBounds(tms[1], tms[2], tms[0]))
 
-        images: list[PngImage] = []
+    def _get_layer_file_index(self, tile_request: TileCreateRequest, check_files: bool = False) -> LayerFileIndex:
+        """The R-tree is built again only when the request files change, from the footprints known so far"""
+        directory = tile_request.get_directory_path()
+        index = self._layer_file_indexes.get(directory)
+        if index is not None and (not check_files or index.has_files(tile_request.files)):
+            return index
+
+        # Follow-up requests carry fewer files, known footprints are kept so switching back opens nothing
+        footprints = self._layer_footprints.setdefault(directory, dict())
         for file in tile_request.files:
-            image = self._get_file_tile_image_if_exists(tile_request, file)
-            if image is None:
-                return
-            images.append(image)
+            if file.name not in footprints:
+                gdal2tiles = self._get_file_tile_creator_instance(tile_request, file).gdal2tiles
+                footprints[file.name] = (gdal2tiles.ominx, gdal2tiles.ominy, gdal2tiles.omaxx, gdal2tiles.omaxy)
 
-        self._logger.debug('Creating tile from file tiles: %s' % tile_request.get_tile_path())
-        tile = ImageUtil.new('RGBA', (256, 256), (255, 255, 255, 0))
-        for image in images:
-            tile.paste(image, (0, 0), image)
+        self._logger.debug('Indexing %d file(s) of %s' % (len(tile_request.files), directory))
+        index = LayerFileIndex(directory, list(tile_request.files), footprints)
+        self._layer_file_indexes[directory] = index
+        return index
 
-        tile_path = tile_request.get_tile_path()
-        os.makedirs(os.path.dirname(tile_path), exist_ok=True)
-        tile.save(tile_path, "png")
-        tile.close()
-        for image in images:
-            image.close()
+    def _create_tile_if_file_tiles_exist(self, tile_request: TileCreateRequest):
+        if tile_request.exist():
+            return
 
-        for file in tile_request.files:
-            tile_file_path = tile_request.get_file_tile_path(file)
-            if os.path.exists(tile_file_path):
-                os.remove(tile_file_path)
+        images: list[PngImage] = []
+        try:
+            for file in tile_request.files:
+                image = self._get_file_tile_image_if_exists(tile_request, file)
+                if image is None:
+                    return
+                images.append(image)
+
+            self._logger.debug('Creating tile from file tiles: %s' % tile_request.get_tile_path())
+            tile = ImageUtil.new('RGBA', (256, 256), (255, 255, 255, 0))
+            for image in images:
+                tile.paste(image, (0, 0), image)
+        finally:
+            for image in images:
+                memory_governor.close_image(image)
+
+        # Journaled, so the file tiles are removed if the worker dies in between
+        entry_id = self._journal.begin(tile_request)
+        try:
+            self._write_final_tile(tile_request, tile)
+            tile.close()
+
+            for file in tile_request.files:
+                tile_file_path = tile_request.get_file_tile_path(file)
+                if os.path.exists(tile_file_path):
+                    os.remove(tile_file_path)
+        finally:
+            self._journal.end(tile_request, entry_id)
 
         parent = tile_request.get_parent()
         self._create_tile_if_child_exists(parent)
 
     def _remove_empty_files(self, tile_request: TileCreateRequest):
-        tile_request.files[:] = [file for file in tile_request.files if
-                                 not self._is_empty_file_tile(tile_request, file)]
+        tile_request.files[:] = [file for file in self._get_intersecting_files(tile_request)
+                                 if not self._is_empty_file_tile(tile_request, file)]
 
     @staticmethod
     def _get_tile_job_info(gdal_2_tiles: GDAL2Tiles) -> TileJobInfo:
@@ -326,8 +627,11 @@ class TileCreator:
         )
 
     @staticmethod
-    def _scale_query_to_tile(dataset_query, dataset_tile, options, tile_file_name=""):
-        """Scales down query dataset to the tile dataset"""
+    def _scale_query_to_tile(dataset_query, dataset_tile, options, tile_file_name="") -> PngImage | None:
+        """
+        Scales down query dataset to the tile dataset.
+        For 'antialias' the scaled PIL image is returned instead, to be encoded by the caller.
+        """
 
         query_size = dataset_query.RasterXSize
         tile_size = dataset_tile.RasterXSize
@@ -345,7 +649,7 @@ class TileCreator:
                     # exit_with_error(
                     #     "RegenerateOverview() failed on %s, error %d" % (tilefilename, res)
                     # )
-                    return
+                    return None
 
         elif options.resampling == "antialias" and numpy_available:
 
@@ -365,14 +669,9 @@ class TileCreator:
             if os.path.exists(tile_file_name):
                 im0 = ImageUtil.open(tile_file_name)
                 im1 = ImageUtil.composite(im1, im0, im1)
+                im0.close()
 
-            params = {}
-            if options.tiledriver == "WEBP":
-                if options.webp_lossless:
-                    params["lossless"] = True
-                else:
-                    params["quality"] = options.webp_quality
-            im1.save(tile_file_name, options.tiledriver, **params)
+            return im1
 
         else:
 
@@ -391,6 +690,8 @@ class TileCreator:
                 # )
                 pass
 
+        return None
+
     @staticmethod
     def _get_resampling(str_resampling: str) -> int:
         if str_resampling == "near":
@@ -0,0 +1,89 @@
+import io
+
+from PIL import Image as ImageUtil
+from PIL.Image import Image as PngImage
+
+from model.rabbit_message import TileEncoding
+
+# zlib strategies accepted by the PIL PNG encoder as 'compress_type'
+_PNG_STRATEGIES = {
+    'default': 0,
+    'filtered': 1,
+    'huffman': 2,
+    'rle': 3,
+    'fixed': 4,
+}
+
+
+class TileEncoder:
+
+    @staticmethod
+    def encode(image: PngImage, encoding: TileEncoding) -> bytes:
+        """Encodes a final tile according to the layer encoding profile"""
+        tile_format = TileEncoder.resolve_format(image, encoding)
+
+        buffer = io.BytesIO()
+        if tile_format == 'JPEG':
+            image.convert('RGB').save(buffer, 'JPEG', quality=encoding.jpegQuality)
+
+        elif tile_format == 'WEBP':
+            if encoding.webpLossless:
+                image.save(buffer, 'WEBP', lossless=True, method=encoding.webpMethod)
+            else:
+                image.save(buffer, 'WEBP', quality=encoding.webpQuality, method=encoding.webpMethod)
+
+        elif tile_format == 'PNG8':
+            palette_image = image.quantize(colors=encoding.paletteColors, method=ImageUtil.Quantize.FASTOCTREE)
+            TileEncoder._save_png(palette_image, buffer, encoding.pngCompressLevel, encoding.pngStrategy)
+            palette_image.close()
+
+        else:
+            TileEncoder._save_png(image, buffer, encoding.pngCompressLevel, encoding.pngStrategy)
+
+        return buffer.getvalue()
+
+    @staticmethod
+    def encode_intermediate(image: PngImage, encoding: TileEncoding) -> bytes:
+        """File tiles are only kept until compositing, so they are stored as lossless PNG with a fast level"""
+        buffer = io.BytesIO()
+        TileEncoder._save_png(image, buffer, encoding.intermediateCompressLevel, 'default')
+        return buffer.getvalue()
+
+    @staticmethod
+    def resolve_format(image: PngImage, encoding: TileEncoding) -> str:
+        tile_format = encoding.format.upper()
+        if tile_format not in ('JPEG', 'AUTO'):
+            return tile_format
+
+        if TileEncoder.is_opaque(image):
+            return 'JPEG'
+
+        # JPEG has no alpha channel
+        return encoding.transparentFormat.upper()
+
+    @staticmethod
+    def is_lossy(image: PngImage, encoding: TileEncoding) -> bool:
+        tile_format = TileEncoder.resolve_format(image, encoding)
+        if tile_format == 'WEBP':
+            return not encoding.webpLossless
+
+        return tile_format in ('JPEG', 'PNG8')
+
+    @staticmethod
+    def is_opaque(image: PngImage) -> bool:
+        if 'A' not in image.getbands():
+            return True
+
+        return image.getchannel('A').getextrema()[0] == 255
+
+    @staticmethod
+    def get_gdal_creation_options(driver_name: str, encoding: TileEncoding) -> list[str]:
+        if driver_name == 'PNG':
+            return ['ZLEVEL=%d' % encoding.intermediateCompressLevel]
+
+        return []
+
+    @staticmethod
+    def _save_png(image: PngImage, buffer: io.BytesIO, compress_level: int, strategy: str):
+        image.save(buffer, 'PNG', compress_level=compress_level,
+                   compress_type=_PNG_STRATEGIES.get(strategy.lower(), 0))
@@ -0,0 +1,197 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+from model.http_config import HttpConfig
+from model.rabbit_message import TileCreateRequest
+from util.tile_cache import CachedTile, TileMemoryCache
+from util.tile_creator import TileCreator
+
+# The layer name can not start with a dot, so '.' and '..' never leave the layers directory
+_TILE_URL = re.compile(r'^/([A-Za-z0-9_][A-Za-z0-9_.-]*)/(\d+)/(\d+)/(\d+)(?:\.\w+)?/?$')
+
+# Deepest zoom of the GlobalMercator tile grid (tminmax of GDAL2Tiles)
+_MAX_ZOOM = 31
+
+
+class TileRenderPending(Exception):
+    """The render time limit was reached, the tile is completed by a follow-up request"""
+
+
+class TileHttpServer:
+    """
+    Serves GET /{layer}/{z}/{x}/{y} from the tile store, rendering missed tiles synchronously up to a time limit.
+    Each layer is a sub directory of the layers directory with a layer.json TileCreateRequest template.
+    """
+    _config: HttpConfig
+    _tile_creator: TileCreator
+    _publish_tile_request: Callable[[TileCreateRequest], None]
+    _cache: TileMemoryCache
+    _templates: dict[str, tuple[float, TileCreateRequest]]
+    _in_flight: dict[str, Future]
+    _lock: threading.Lock
+    _server: ThreadingHTTPServer
+    _logger: logging.Logger
+
+    def __init__(self, config: HttpConfig, tile_creator: TileCreator,
+                 publish_tile_request: Callable[[TileCreateRequest], None], cache: TileMemoryCache):
+        self._logger = logging.getLogger(__name__)
+        self._config = config
+        self._tile_creator = tile_creator
+        self._publish_tile_request = publish_tile_request
+        self._cache = cache
+        self._templates = dict()
+        self._in_flight = dict()
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self._config.host, self._config.port), self._create_handler())
+        self._server.daemon_threads = True
+        thread = threading.Thread(target=self._server.serve_forever, daemon=True, name='tile-http-server')
+        thread.start()
+        self._logger.info('Serving tiles on http://%s:%d ...' % (self._config.host, self._config.port))
+
+    def get_tile(self, layer: str, z: int, x: int, y: int) -> CachedTile | None:
+        tile_request = self._get_tile_request(layer, z, x, y)
+        if tile_request is None:
+            return None
+
+        tile_path = tile_request.get_tile_path()
+        tile = self._cache.get(tile_path)
+        if tile is not None:
+            return tile
+
+        with self._lock:
+            future = self._in_flight.get(tile_path)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[tile_path] = future
+
+        # Single flight: concurrent misses of the same tile wait for the first one
+        if not owner:
+            return future.result()
+
+        try:
+            tile = self._load_or_render(tile_request)
+            future.set_result(tile)
+            return tile
+        except BaseException as exception:
+            future.set_exception(exception)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[tile_path]
+
+    def _load_or_render(self, tile_request: TileCreateRequest) -> CachedTile | None:
+        tile_path = tile_request.get_tile_path()
+        if not os.path.exists(tile_path):
+            self._logger.debug('Rendering tile on demand: %s' % tile_path)
+            deadline = time.perf_counter() + self._config.render_timeout_ms / 1000
+            # Each call makes progress, it is repeated while the request budget runs out
+            while self._tile_creator.create_tile(tile_request.model_copy(deep=True)):
+                if time.perf_counter() >= deadline:
+                    # A large subtree is left to the consumers instead of holding the tile creator
+                    self._logger.debug('Render time limit reached, scheduling follow-up: %s' % tile_path)
+                    self._publish_tile_request(tile_request)
+                    raise TileRenderPending(tile_path)
+
+        if not os.path.exists(tile_path):
+            return None
+
+        with open(tile_path, 'rb') as f:
+            content = f.read()
+
+        tile = CachedTile(content, '"%s"' % hashlib.blake2b(content, digest_size=16).hexdigest())
+        self._cache.put(tile_path, tile)
+        return tile
+
+    def _get_tile_request(self, layer: str, z: int, x: int, y: int) -> TileCreateRequest | None:
+        template_path = os.path.join(self._config.layers_directory, layer, 'layer.json')
+        if not os.path.exists(template_path):
+            return None
+
+        modified = os.path.getmtime(template_path)
+        entry = self._templates.get(layer)
+        if entry is None or entry[0] != modified:
+            with open(template_path, 'r') as f:
+                entry = (modified, TileCreateRequest.model_validate_json(f.read()))
+            self._templates[layer] = entry
+
+        tile_request = entry[1].model_copy(deep=True)
+        tile_request.z = z
+        tile_request.x = x
+        tile_request.y = y
+        return tile_request
+
+    @staticmethod
+    def _get_content_type(content: bytes) -> str:
+        if content.startswith(b'\x89PNG'):
+            return 'image/png'
+
+        if content.startswith(b'\xff\xd8'):
+            return 'image/jpeg'
+
+        if content[:4] == b'RIFF' and content[8:12] == b'WEBP':
+            return 'image/webp'
+
+        return 'application/octet-stream'
+
+    def _create_handler(self):
+        server = self
+
+        class TileRequestHandler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                match = _TILE_URL.match(self.path.split('?')[0])
+                if match is None:
+                    self.send_error(404)
+                    return
+
+                layer, z, x, y = match.group(1), int(match.group(2)), int(match.group(3)), int(match.group(4))
+                # Checked before 2 ** z, a huge zoom would allocate a huge integer
+                if z > _MAX_ZOOM or x >= 2 ** z or y >= 2 ** z:
+                    self.send_error(404)
+                    return
+
+                try:
+                    tile = server.get_tile(layer, z, x, y)
+                except TileRenderPending:
+                    self.send_response(503)
+                    self.send_header('Retry-After', '1')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                except Exception as exception:
+                    server._logger.error('Occur Error in serving tile: %s with error: %s' %
+                                         (self.path, repr(exception)))
+                    self.send_error(500)
+                    return
+
+                if tile is None:
+                    self.send_error(404)
+                    return
+
+                if self.headers.get('If-None-Match') == tile.etag:
+                    self.send_response(304)
+                    self.send_header('ETag', tile.etag)
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', server._get_content_type(tile.content))
+                self.send_header('Content-Length', str(len(tile.content)))
+                self.send_header('ETag', tile.etag)
+                self.end_headers()
+                self.wfile.write(tile.content)
+
+            def log_message(self, format, *args):
+                server._logger.debug('HTTP %s' % (format % args))
+
+        return TileRequestHandler
@@ -0,0 +1,135 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, wait
+from typing import Any, Callable, List
+
+from model.pipeline_stage_stats import PipelineStageStats
+
+
+class _PipelineItem:
+    payload: Any
+    future: Future
+
+    def __init__(self, payload: Any):
+        self.payload = payload
+        self.future = Future()
+
+
+class PipelineStage:
+    name: str
+    function: Callable[[Any], Any]
+    input_queue: queue.Queue
+    stats: PipelineStageStats
+    lock: threading.Lock
+
+    def __init__(self, name: str, function: Callable[[Any], Any], worker_count: int, queue_size: int):
+        self.name = name
+        self.function = function
+        self.input_queue = queue.Queue(maxsize=queue_size)
+        self.stats = PipelineStageStats(name, worker_count)
+        self.lock = threading.Lock()
+
+
+class TilePipeline:
+    """
+    Runs payloads through a chain of stages joined by bounded queues.
+    Each stage has its own worker threads; a full queue blocks the upstream stage (backpressure).
+    """
+    _stages: List[PipelineStage]
+    _queue_size: int
+    _started: bool = False
+    _logger: logging.Logger
+
+    def __init__(self, queue_size: int):
+        self._logger = logging.getLogger(__name__)
+        self._stages = []
+        self._queue_size = max(queue_size, 1)
+
+    def add_stage(self, name: str, function: Callable[[Any], Any], worker_count: int) -> 'TilePipeline':
+        if self._started:
+            raise Exception('Can not add stage "%s" to a started pipeline' % name)
+
+        self._stages.append(PipelineStage(name, function, max(worker_count, 1), self._queue_size))
+        return self
+
+    def start(self):
+        if self._started:
+            return
+
+        self._started = True
+        for index, stage in enumerate(self._stages):
+            for worker in range(stage.stats.worker_count):
+                thread = threading.Thread(target=self._work, args=(index,), daemon=True,
+                                          name='tile-pipeline-%s-%d' % (stage.name, worker))
+                thread.start()
+
+        self._logger.info('Tile pipeline started with stages: %s' %
+                          ', '.join('%s(%d)' % (stage.name, stage.stats.worker_count) for stage in self._stages))
+
+    def submit(self, payload: Any) -> Future:
+        self.start()
+        item = _PipelineItem(payload)
+        self._put(self._stages[0], item)
+        return item.future
+
+    def run(self, payloads: List[Any]) -> List[Any]:
+        """Submits all payloads, waits for them and returns the results in submission order"""
+        if not payloads:
+            return []
+
+        futures = [self.submit(payload) for payload in payloads]
+        wait(futures)
+        return [future.result() for future in futures]
+
+    def get_stats(self) -> List[PipelineStageStats]:
+        return [stage.stats for stage in self._stages]
+
+    def log_stats(self):
+        for stats in self.get_stats():
+            self._logger.debug('Pipeline stage %s' % stats)
+
+    def _work(self, index: int):
+        stage = self._stages[index]
+        next_stage = self._stages[index + 1] if index + 1 < len(self._stages) else None
+
+        while True:
+            idle_start = time.perf_counter()
+            item: _PipelineItem = stage.input_queue.get()
+            busy_start = time.perf_counter()
+
+            try:
+                item.payload = stage.function(item.payload)
+                failed = False
+            except BaseException as exception:
+                item.future.set_exception(exception)
+                failed = True
+
+            busy_end = time.perf_counter()
+            with stage.lock:
+                stage.stats.idle_seconds += busy_start - idle_start
+                stage.stats.busy_seconds += busy_end - busy_start
+                if failed:
+                    stage.stats.failed += 1
+                else:
+                    stage.stats.processed += 1
+
+            stage.input_queue.task_done()
+            if failed:
+                continue
+
+            if next_stage is None:
+                item.future.set_result(item.payload)
+                continue
+
+            self._put(next_stage, item)
+            with stage.lock:
+                stage.stats.blocked_seconds += time.perf_counter() - busy_end
+
+    @staticmethod
+    def _put(stage: PipelineStage, item: _PipelineItem):
+        stage.input_queue.put(item)
+        depth = stage.input_queue.qsize()
+        with stage.lock:
+            stage.stats.max_queue_depth = max(stage.stats.max_queue_depth, depth)
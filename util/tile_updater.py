@@ -0,0 +1,175 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+import gdal2tiles as g2t
+
+from model.rabbit_message import RasterUpdateRequest, TileCreateRequest, FileTileCreate
+from util.raster_fingerprint import compute_fingerprint, get_changed_mercator_bounds, load_fingerprint, \
+    save_fingerprint, get_fingerprint_path
+from util.spatial_index import SpatialIndex, Bounds
+from util.tile_cache import TileMemoryCache
+from util.tile_creator import TileCreator
+
+mercator = g2t.GlobalMercator()
+
+
+class TileUpdater:
+    """
+    Invalidates only the tiles touched by the changed region of an updated source raster.
+    The removed tiles are rebuilt by publishing them as tile create requests.
+    Fingerprinting and invalidation read the whole raster, so they run on a worker thread, one at a time.
+    """
+    _tile_creator: TileCreator
+    _publish_tile_request: Callable[[TileCreateRequest], None]
+    _tile_cache: TileMemoryCache | None
+    _executor: ThreadPoolExecutor
+    _logger: logging.Logger
+
+    def __init__(self, tile_creator: TileCreator, publish_tile_request: Callable[[TileCreateRequest], None],
+                 tile_cache: TileMemoryCache | None = None):
+        self._logger = logging.getLogger(__name__)
+        self._tile_creator = tile_creator
+        self._publish_tile_request = publish_tile_request
+        self._tile_cache = tile_cache
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tile-updater')
+        # The fingerprint the tiles were created from is recorded when a raster is first opened for tiling
+        tile_creator.raster_opened_listener = self.record_fingerprint
+
+    def submit(self, request: RasterUpdateRequest, done: Callable[[], None]):
+        """Runs the update on the worker thread and calls done afterwards, whether it failed or not"""
+        self._executor.submit(self._run_update, request, done)
+
+    def record_fingerprint(self, raster_file_path: str):
+        self._executor.submit(self._record_fingerprint, raster_file_path)
+
+    def _record_fingerprint(self, raster_file_path: str):
+        if os.path.exists(get_fingerprint_path(raster_file_path)):
+            return
+
+        try:
+            self._logger.info('Recording fingerprint of %s ...' % raster_file_path)
+            save_fingerprint(raster_file_path, compute_fingerprint(raster_file_path))
+        except Exception as exception:
+            self._logger.error('Occur Error in recording fingerprint of %s with error: %s' %
+                               (raster_file_path, repr(exception)))
+
+    def _run_update(self, request: RasterUpdateRequest, done: Callable[[], None]):
+        try:
+            self.update(request)
+        except Exception as exception:
+            self._logger.error('Occur Error in updating tiles: %s with error: %s' %
+                               (request.model_dump_json(), repr(exception)))
+            import traceback
+            traceback.print_exc()
+        finally:
+            done()
+
+    def update(self, request: RasterUpdateRequest):
+        file = request.get_updated_file()
+        raster_file_path = request.get_raster_file_path(file)
+
+        self._logger.info('Detecting changes of %s ...' % raster_file_path)
+        new_fingerprint = compute_fingerprint(raster_file_path)
+        old_fingerprint = load_fingerprint(raster_file_path)
+
+        self._tile_creator.evict_raster(raster_file_path)
+        if old_fingerprint is None:
+            # Without the previous content there is nothing to compare, the whole pyramid is not wiped for it
+            self._logger.warning('No fingerprint was recorded for %s, nothing is invalidated' % raster_file_path)
+            save_fingerprint(raster_file_path, new_fingerprint)
+            return
+
+        changed_bounds = get_changed_mercator_bounds(old_fingerprint, new_fingerprint)
+        if not changed_bounds:
+            self._logger.info('No change detected in %s' % raster_file_path)
+            save_fingerprint(raster_file_path, new_fingerprint)
+            return
+
+        # No tile is created deeper than the zoom range of the raster
+        max_zoom = min(request.maxZoom, self._tile_creator.get_max_zoom(request, file))
+        removed = self._remove_tiles(request, file, changed_bounds, max_zoom)
+        self._logger.info('%d changed block(s) in %s, %d tile(s) removed' %
+                          (len(changed_bounds), raster_file_path, len(removed)))
+
+        # Saved after invalidation: if the rebuild is interrupted, the removed tiles are created again on demand
+        save_fingerprint(raster_file_path, new_fingerprint)
+
+        if request.rebuild:
+            self._rebuild_tiles(removed)
+
+    def _remove_tiles(self, request: RasterUpdateRequest, file: FileTileCreate, bounds: List[Bounds],
+                      max_zoom: int) -> List[TileCreateRequest]:
+        """
+        Walks the tiles intersecting any of the bounds from minZoom down and removes their stored files.
+        Down to startCreateTileZoom every tile is visited, as a stored tile may be below a missing parent there;
+        deeper, only the children of stored tiles are visited.
+        Returns the tiles which had any stored file.
+        """
+        index = SpatialIndex([(bound, True) for bound in bounds])
+        stack = list(self._get_start_tiles(request, bounds))
+        removed: List[TileCreateRequest] = []
+        while stack:
+            z, tms_x, tms_y = stack.pop()
+            tile_request = request.get_tile_request(z, tms_x, self._tms_y_to_request_y(request, z, tms_y))
+            if self._remove_tile(request, file, tile_request):
+                removed.append(tile_request)
+            elif z >= request.startCreateTileZoom:
+                continue
+
+            if z >= max_zoom:
+                continue
+
+            for child_x in (tms_x * 2, tms_x * 2 + 1):
+                for child_y in (tms_y * 2, tms_y * 2 + 1):
+                    if index.query(mercator.TileBounds(child_x, child_y, z + 1)):
+                        stack.append((z + 1, child_x, child_y))
+
+        return removed
+
+    @staticmethod
+    def _get_start_tiles(request: RasterUpdateRequest, bounds: List[Bounds]) -> set[tuple[int, int, int]]:
+        """TMS positions of minZoom intersecting any of the bounds"""
+        tiles = set()
+        max_index = 2 ** request.minZoom - 1
+        for min_x, min_y, max_x, max_y in bounds:
+            start = mercator.MetersToTile(min_x, min_y, request.minZoom)
+            end = mercator.MetersToTile(max_x, max_y, request.minZoom)
+            for tms_x in range(max(start[0], 0), min(end[0], max_index) + 1):
+                for tms_y in range(max(start[1], 0), min(end[1], max_index) + 1):
+                    tiles.add((request.minZoom, tms_x, tms_y))
+
+        return tiles
+
+    @staticmethod
+    def _tms_y_to_request_y(request: RasterUpdateRequest, z: int, tms_y: int) -> int:
+        if request.startPoint == 'BOTTOM_LEFT' or request.startPoint == 'BOTTOM_RIGHT':
+            return tms_y
+
+        return 2 ** z - 1 - tms_y
+
+    def _remove_tile(self, request: RasterUpdateRequest, file: FileTileCreate,
+                     tile_request: TileCreateRequest) -> bool:
+        paths = [tile_request.get_tile_path()]
+        if tile_request.z <= request.startCreateTileZoom:
+            paths.append(tile_request.get_lossless_tile_path())
+        if tile_request.z >= request.startCreateTileZoom:
+            # File tiles of the other files do not depend on the updated raster
+            paths.append(tile_request.get_file_tile_path(file))
+
+        existing = [path for path in paths if os.path.exists(path)]
+        for path in existing:
+            os.remove(path)
+
+        if existing and self._tile_cache is not None:
+            self._tile_cache.remove(tile_request.get_tile_path())
+
+        return bool(existing)
+
+    def _rebuild_tiles(self, tile_requests: List[TileCreateRequest]):
+        # Deepest zoom first, so each parent is composited from children which are already rebuilt
+        tile_requests.sort(key=lambda tile_request: (-tile_request.z, tile_request.x, tile_request.y))
+        self._logger.info('Publishing %d removed tile(s) to be created again' % len(tile_requests))
+        for tile_request in tile_requests:
+            self._publish_tile_request(tile_request)
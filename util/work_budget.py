@@ -0,0 +1,44 @@
+import logging
+
+from model.request_budget import RequestBudget
+
+
+class WorkBudgetController:
+    """
+    Gives each tile request a wall-clock budget and learns the render cost of every source raster
+    from measured times, so the number of tiles rendered per request follows the latency target.
+    """
+    _target_ms: float
+    _queue_depth_scale: int
+    _default_cost_ms: float = 250.0
+    _smoothing: float = 0.3
+    _costs: dict[str, float]
+    _queue_depth: int = 0
+    _logger: logging.Logger
+
+    def __init__(self, target_ms: float, queue_depth_scale: int):
+        self._logger = logging.getLogger(__name__)
+        self._target_ms = target_ms
+        self._queue_depth_scale = max(queue_depth_scale, 1)
+        self._costs = dict()
+
+    def set_queue_depth(self, queue_depth: int):
+        self._queue_depth = max(queue_depth, 0)
+
+    def get_queue_depth(self) -> int:
+        return self._queue_depth
+
+    def new_budget(self, max_tiles: int) -> RequestBudget:
+        # With a backlog each request gets a smaller slice, so queued requests are not starved
+        budget_ms = self._target_ms / (1 + self._queue_depth / self._queue_depth_scale)
+        return RequestBudget(budget_ms, max_tiles)
+
+    def estimate_ms(self, key: str) -> float:
+        return self._costs.get(key, self._default_cost_ms)
+
+    def record(self, key: str, elapsed_ms: float):
+        previous = self._costs.get(key)
+        if previous is None:
+            self._costs[key] = elapsed_ms
+        else:
+            self._costs[key] = previous + self._smoothing * (elapsed_ms - previous)